@@ -0,0 +1,782 @@
+# library interface for video shittifier
+#
+# compress() is the whole compression job without the console: a JobPlan goes in, a result dict comes
+# out, and everything there is to tell along the way (notes, warnings, encoder progress) arrives as
+# event dicts on a callback instead of being printed. Nothing here touches tkinter, colorama or
+# global state, so it can be imported cheaply and run from services, and several jobs can run in one
+# process. main.compress_video is the console client on top of it.
+#
+# Events:
+#
+#   {'type': 'message', 'time': unix time, 'level': 'info' | 'warning' | 'error' | 'success' | 'result', 'text': ...}
+#   {'type': 'progress', ...}   a progress event, see progress.py
+#
+# AsyncCompressor runs jobs from asyncio, each in its own worker process (python api.py --worker),
+# at most a given number at a time, and a cancelled task takes its worker and ffmpeg down with it.
+
+import builtins
+import json
+import os
+import signal
+import sys
+import time
+from collections import namedtuple
+
+from engines import get_engine, find_ffmpeg, plan_streams
+from segments import encode_segmented, checkpoint_count, resume_dir_for
+from generations import encode_generations
+from probe import probe
+from cache import ResultCache, cache_key
+from progress import JsonLinesWriter, broadcast
+from scheduler import plan_job
+from memory import MemoryMonitor, bounded_encoder_args
+from estimate import estimate
+from geometry import plan_geometry, geometry_filters, MIN_BPP
+from effects import parse_effects, effect_graph, effect_names, fps_filters, encode_frame_effects
+from metrics import StageProfiler, write_metrics
+
+# Everything compress_video takes, minus the console options. cache is None (use $SHITTIFIER_CACHE_DIR
+# if set), False or a ResultCache; effects can include custom frame functions (see effects.py).
+# profile adds result['profile'], metrics_path also writes it out (see metrics.py).
+JobPlan = namedtuple('JobPlan', [
+    'input_path',
+    'output_path',
+    'target_size_mb',
+    'percentage',
+    'audio_quality',
+    'threads',
+    'engine',
+    'rate_control',
+    'size_tolerance',
+    'segments',
+    'cache',
+    'generations',
+    'preset',
+    'memory_limit_mb',
+    'resume',
+    'on_infeasible',
+    'downscale',
+    'effects',
+    'progress_log',
+    'profile',
+    'metrics_path',
+], defaults=(None, None, 'medium', None, 'auto', 'single', 5.0, None, None, 1, 'medium', None, False, None, True, None, None,
+             False, None))
+
+# Retries with another output name when the output can't be written, counted together with the
+# broken pipe bump to 0.5 MB
+MAX_RETRIES = 3
+
+
+def partial_path_for(output_path):
+    """Hidden name in the same directory that an output is written under until it is complete"""
+    directory, name = os.path.split(output_path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.partial{ext}")
+
+
+AUDIO_BITRATE_RATIOS = {'high': 0.20, 'medium': 0.15, 'low': 0.10, 'very-low': 0.05}
+
+AUDIO_PRESETS = {
+    'h': 'high', 'high': 'high',
+    'm': 'medium', 'medium': 'medium',
+    'l': 'low', 'low': 'low',
+    'v': 'very-low', 'very-low': 'very-low',
+}
+
+
+def parse_audio_quality(value):
+    """Accept the interactive presets (h/m/l/v or their names) or a 1-100 custom percentage.
+    Returns the audio_quality to plan with ('low', 'custom-30.0', ...); ValueError if it's neither."""
+    value = str(value).lower()
+    if value in AUDIO_PRESETS:
+        return AUDIO_PRESETS[value]
+    try:
+        custom_percent = float(value)
+    except ValueError:
+        raise ValueError(f"invalid audio quality '{value}' (use h/m/l/v or 1-100)")
+    if not 1 <= custom_percent <= 100:
+        raise ValueError("custom audio quality must be between 1 and 100")
+    return f"custom-{custom_percent}"
+
+
+def audio_ratio_for(audio_quality):
+    """Share of the bit budget that goes to audio for an audio quality preset or 'custom-<percent>'"""
+    if audio_quality.startswith('custom-'):
+        try:
+            return float(audio_quality.split('-')[1]) / 100
+        except (ValueError, IndexError):
+            pass
+    return AUDIO_BITRATE_RATIOS.get(audio_quality, 0.15)
+
+
+def calculate_bitrates(target_size_mb, duration, has_audio, audio_bitrate_ratio):
+    """Split the bit budget of target_size_mb over duration seconds into ffmpeg video/audio bitrate strings"""
+    total_kbits = (target_size_mb * 8192)
+    
+    if not has_audio:
+        audio_kbits = 0
+        video_kbits = total_kbits
+        audio_bitrate = '0k'
+    else:
+        audio_kbits = total_kbits * audio_bitrate_ratio
+        video_kbits = total_kbits - audio_kbits
+        audio_bitrate = str(max(8, int(audio_kbits / duration))) + 'k'  # Minimum 8k audio bitrate
+    
+    video_bitrate = str(max(10, int(video_kbits / duration))) + 'k'  # Minimum 10k video bitrate
+    return video_bitrate, audio_bitrate
+
+
+class _Retry(Exception):
+    """Start over with a changed plan; reason is the profile counter it goes under.
+    feasibility is the estimate that led to it, for the result of the next attempt."""
+
+    def __init__(self, plan, reason, feasibility=None):
+        super().__init__()
+        self.plan = plan
+        self.reason = reason
+        self.feasibility = feasibility
+
+
+def compress(plan, on_event=None, retry_count=0):
+    """Run a JobPlan and return the result dict. Messages and progress go to on_event (see above).
+    Failures raise: IOError/OSError for encoder and file problems, PermissionError when the output
+    can't be written, ValueError for unreachable targets, MemoryError when the memory ceiling was hit."""
+    profiler = StageProfiler(plan.profile or bool(plan.metrics_path))
+
+    def export(profile):
+        if not plan.metrics_path:
+            return
+        try:
+            write_metrics(plan.metrics_path, [({'input': plan.input_path, 'output': plan.output_path}, profile)])
+        except OSError as e:
+            # Same as the cache: the metrics are never worth the compressed video
+            if on_event:
+                on_event({'type': 'message', 'time': time.time(), 'level': 'warning',
+                          'text': f"Warning: Could not write the metrics to {plan.metrics_path}: {e}"})
+
+    feasibility = None
+    try:
+        while True:
+            try:
+                result = _compress_once(plan, on_event, retry_count, profiler, feasibility)
+                break
+            except _Retry as retry:
+                profiler.checkpoint('retry')
+                profiler.count(retry.reason)
+                plan = retry.plan
+                feasibility = retry.feasibility or feasibility
+                retry_count += 1
+    except BaseException:
+        profiler.checkpoint('failed')
+        export(profiler.summary('error'))
+        raise
+    if profiler.enabled:
+        result['profile'] = profiler.summary('cached' if result['cached'] else 'ok')
+        export(result['profile'])
+    return result
+
+
+def _compress_once(plan, on_event, retry_count, profiler, feasibility=None):
+    def emit(level, text):
+        if on_event:
+            on_event({'type': 'message', 'time': time.time(), 'level': level, 'text': text})
+
+    input_path, output_path = plan.input_path, plan.output_path
+    target_size_mb, percentage, audio_quality = plan.target_size_mb, plan.percentage, plan.audio_quality
+    threads, engine, preset = plan.threads, plan.engine, plan.preset
+    rate_control, size_tolerance = plan.rate_control, plan.size_tolerance
+    segments, generations, resume = plan.segments, plan.generations, plan.resume
+    cache, memory_limit_mb, on_infeasible = plan.cache, plan.memory_limit_mb, plan.on_infeasible
+    downscale, effects, progress_log = plan.downscale, plan.effects, plan.progress_log
+
+    valid_audio_qualities = ['high', 'medium', 'low', 'very-low']
+    # Allow custom audio quality values (they start with 'custom-')
+    if audio_quality not in valid_audio_qualities and not audio_quality.startswith('custom-'):
+        emit('warning', f"Warning: Invalid audio quality '{audio_quality}'. Defaulting to 'medium'.")
+        audio_quality = 'medium'
+
+    # cache=None means "use $SHITTIFIER_CACHE_DIR if it is set", cache=False turns caching off
+    if cache is None and os.environ.get('SHITTIFIER_CACHE_DIR'):
+        cache = ResultCache()
+
+    if rate_control not in ('single', 'two-pass'):
+        emit('warning', f"Warning: Invalid rate control '{rate_control}'. Defaulting to 'single'.")
+        rate_control = 'single'
+        
+    if target_size_mb is not None and target_size_mb < 0.1:
+        emit('warning', f"Warning: Target size is very small ({target_size_mb:.2f} MB).")
+        emit('warning', "This may cause compression errors. Adjusting to minimum size of 0.1 MB.")
+        target_size_mb = 0.1
+        profiler.count('min_size_bumps')
+    
+    profiler.checkpoint('setup')
+    info = probe(input_path)
+    profiler.checkpoint('probe')
+
+    if percentage is not None:
+        estimated_size = info.size * (percentage / 100) / (1024 * 1024)
+        if estimated_size < 0.1:
+            emit('warning', f"Warning: Target percentage would result in a very small file ({estimated_size:.2f} MB).")
+            emit('warning', "This may cause compression errors. Consider using a higher percentage.")
+    
+    if os.path.exists(output_path):
+        try:
+            with open(output_path, 'a'):
+                pass
+        except PermissionError:
+            if retry_count < MAX_RETRIES:
+                emit('warning', "Output file is in use or cannot be accessed. Trying with a different filename...")
+                # Generate a new output path with a unique suffix
+                filename, ext = os.path.splitext(output_path)
+                new_output_path = f"{filename}_{retry_count+1}{ext}"
+                raise _Retry(plan._replace(output_path=new_output_path), 'permission_retries')
+            else:
+                raise PermissionError(f"Cannot access the output file after {retry_count} retries. Please close any applications using the file.")
+    
+    has_audio = info.has_audio
+    
+    if not has_audio:
+        emit('warning', "Note: This video does not have an audio track.")
+        emit('warning', "Audio compression will be skipped.")
+    
+    original_size = info.size / (1024 * 1024)
+    
+    if percentage is not None:
+        target_size_mb = original_size * (percentage / 100)
+        emit('info', f"Compressing to {percentage}% of original size ({target_size_mb:.2f} MB)")
+    else:
+        # Use provided target size
+        emit('info', f"Compressing to target size of {target_size_mb} MB")
+
+    duration = info.duration
+    if not duration:
+        raise IOError(f"Could not read the duration of {input_path}. Is it a valid video file?")
+    
+    audio_bitrate_ratio = audio_ratio_for(audio_quality)
+    if audio_quality in AUDIO_BITRATE_RATIOS:
+        emit('info', f"Using {audio_quality.replace('-', ' ')} audio quality")
+    else:
+        try:
+            emit('info', f"Using custom audio quality: {float(audio_quality.split('-')[1])}% of total bitrate")
+        except (ValueError, IndexError):
+            emit('warning', "Error parsing custom audio quality. Using medium (15%) instead.")
+    
+    video_bitrate, audio_bitrate = calculate_bitrates(target_size_mb, duration, has_audio, audio_bitrate_ratio)
+    
+    if has_audio:
+        emit('info', f"Video bitrate: {video_bitrate}, Audio bitrate: {audio_bitrate}")
+    else:
+        emit('info', f"Video bitrate: {video_bitrate}, No audio stream")
+
+    effects = parse_effects(effects) if effects else []
+    graph = effect_graph(effects)
+    custom = graph['custom']
+    if effects:
+        emit('info', f"Effects: {', '.join(effect_names(effects))}")
+    if custom:
+        # Python functions can't be told apart by the cache key
+        cache = None
+
+    # What the feasibility estimate checks, before generations split it up
+    requested_size_mb = target_size_mb
+
+    encoder = get_engine(engine)
+    segmented = segments is not None and segments > 1
+    fused = generations is not None and generations > 1
+    # Two-pass, segmented and multi-generation encodes drive ffmpeg directly
+    if fused and (segmented or rate_control == 'two-pass'):
+        emit('warning', "Multi-generation encodes use a single pass per generation, without segments.")
+        profiler.count('mode_fallbacks')
+        rate_control = 'single'
+        segmented = False
+    if segmented and rate_control == 'two-pass':
+        emit('warning', "Two-pass encoding is not available for segmented encodes. Using a single pass.")
+        profiler.count('mode_fallbacks')
+        rate_control = 'single'
+    if resume and (fused or rate_control == 'two-pass'):
+        emit('warning', "Resumable encodes are checkpointed in segments, so they use a single pass and one generation.")
+        profiler.count('mode_fallbacks')
+        rate_control = 'single'
+        fused = False
+    if custom and (fused or segmented or resume or rate_control == 'two-pass'):
+        emit('warning', "Custom frame effects run in a single pass, without segments, generations or resume.")
+        profiler.count('mode_fallbacks')
+        rate_control = 'single'
+        segmented = False
+        fused = False
+        resume = False
+    if fused:
+        # Same settings every round: percentage mode shrinks each generation to a share of the
+        # previous one, target size mode aims every generation at the same size
+        if percentage is not None:
+            stage_targets = [original_size * (percentage / 100) ** (n + 1) for n in range(generations)]
+        else:
+            stage_targets = [target_size_mb] * generations
+        stages = [calculate_bitrates(max(0.1, t), duration, has_audio, audio_bitrate_ratio) for t in stage_targets]
+    # Streams that already fit their budget are copied instead of re-encoded
+    streams = None
+    if rate_control == 'single' and not segmented and not fused and not resume:
+        streams = plan_streams(info, video_bitrate, audio_bitrate, output_path)
+        # unless an effect has to change them
+        if graph['video'] or custom:
+            streams['video'] = 'encode'
+        if graph['audio'] and streams['audio']:
+            streams['audio'] = 'encode'
+    stream_copy = streams is not None and 'copy' in streams.values()
+    # A budget too small for the source resolution and frame rate gets fewer, smaller frames instead
+    geometry = None
+    if info.has_video and not (stream_copy and streams['video'] == 'copy'):
+        # Frames the drop effect throws away don't need any bits
+        source = info._replace(fps=min(info.fps, graph['fps'])) if graph['fps'] and info.fps else info
+        # Every generation keeps the first one's geometry, so the last and smallest budget decides it
+        geometry_bitrate = stages[-1][0] if fused else video_bitrate
+        geometry = plan_geometry(source, geometry_bitrate, min_bpp=MIN_BPP if downscale else 0)
+    scaled = geometry is not None and geometry['scaled']
+    if (rate_control == 'two-pass' or segmented or fused or memory_limit_mb or stream_copy or resume or scaled or effects) and not encoder.direct_ffmpeg:
+        if find_ffmpeg():
+            emit('warning', "This mode needs the ffmpeg engine, switching to it.")
+            encoder = get_engine('ffmpeg')
+            profiler.count('engine_fallbacks')
+        else:
+            emit('warning', "This mode needs ffmpeg, which was not found. Using a plain single pass.")
+            profiler.count('plain_pass_fallbacks')
+            if memory_limit_mb:
+                emit('warning', "MoviePy's memory use can't be bounded, the memory ceiling is only reported against.")
+            stream_copy = False
+            if scaled:
+                geometry = plan_geometry(info, video_bitrate, min_bpp=0)
+                scaled = False
+            if effects:
+                emit('warning', "Effects need ffmpeg, encoding without them.")
+                effects = []
+                graph = effect_graph(effects)
+                custom = []
+            resume = False
+            rate_control = 'single'
+            segmented = False
+            fused = False
+    emit('info', f"Encoding with the {encoder.name} engine")
+    if encoder.direct_ffmpeg:
+        # Drop frames and scale first, so the effects have less to chew on
+        encoder.video_filters = fps_filters(graph) + (geometry_filters(geometry) if scaled else []) + graph['video']
+        encoder.audio_filters = graph['audio']
+        encoder.profiler = profiler
+    if scaled:
+        emit('warning', f"{geometry_bitrate} is only {geometry['source_bpp']:.3f} bits per pixel at "
+                        f"{info.width}x{info.height} {info.fps:g}fps, encoding at {geometry['width']}x{geometry['height']} "
+                        f"{geometry['fps']:g}fps instead")
+    if stream_copy:
+        for kind, bitrate in (('video', video_bitrate), ('audio', audio_bitrate)):
+            if streams[kind] == 'copy':
+                emit('success', f"The {kind} stream is already under its {bitrate} budget, copying it instead of re-encoding")
+
+    target_percentage = percentage
+    if fused:
+        if percentage is not None:
+            target_percentage = 100 * (percentage / 100) ** generations
+        target_size_mb = max(0.1, stage_targets[-1])
+        emit('info', f"Compressing {generations} generations in one go, final target {target_size_mb:.2f} MB")
+    if threads is None:
+        # Let the scheduler pick from the free CPUs and the clip's resolution
+        threads = plan_job(info)
+        if segmented:
+            threads = max(1, threads // segments)
+    if memory_limit_mb and encoder.direct_ffmpeg:
+        # Segments and generations run side by side, so they share the ceiling
+        processes = segments if segmented else generations if fused else 1
+        threads, encoder.input_args, encoder.video_args = bounded_encoder_args(
+            geometry['width'] if scaled else info.width, geometry['height'] if scaled else info.height,
+            memory_limit_mb / processes, threads)
+        emit('info', f"Memory ceiling: {memory_limit_mb} MB, lookahead and threads sized to fit")
+    # Generations after the first re-encode without the effects
+    plain_video_args = encoder.video_args
+    if graph['video_args']:
+        encoder.video_args = encoder.video_args + graph['video_args']
+    emit('info', f"Preset: {preset}, {threads} encoder thread(s){' per chunk' if segmented else ''}")
+    if segmented:
+        emit('info', f"Segmented encoding: up to {segments} chunks in parallel")
+    if resume:
+        emit('info', f"Resumable encode, finished chunks are kept in {resume_dir_for(output_path)} until the output is complete")
+    if rate_control == 'two-pass':
+        emit('info', f"Two-pass encoding, tolerance {size_tolerance}% of the target size")
+    passes = None
+    segments_encoded = None
+    generation_stats = None
+
+    profiler.checkpoint('plan')
+    key = None
+    if cache:
+        key = cache_key(input_path, {
+            # The container decides what can be stream-copied, and an .mkv is no use for an .mp4 request
+            'container': os.path.splitext(output_path)[1].lower(),
+            'target_size_mb': target_size_mb if percentage is None else None,
+            'percentage': percentage,
+            'audio_quality': audio_quality,
+            'engine': encoder.name,
+            'rate_control': rate_control,
+            'size_tolerance': size_tolerance if rate_control == 'two-pass' else None,
+            'segments': segments if segmented else None,
+            'generations': generations if fused else None,
+            'preset': preset,
+            'memory_limit_mb': memory_limit_mb,
+            'resume': bool(resume),
+            'downscale': bool(downscale),
+            'effects': effect_names(effects),
+        })
+        cached_result = cache.get(key, output_path)
+        profiler.checkpoint('cache lookup')
+        if cached_result is not None:
+            cached_result['cached'] = True
+            profiler.count('cache_hits')
+            emit('success', "[CACHED] Same video and settings as an earlier run, reusing its output")
+            emit('result', f"Compressed size: {cached_result['final_size']:.2f} MB")
+            return cached_result
+
+    # Sampled encode of a few excerpts to catch unreachable targets before the full encode. It comes
+    # after the cache lookup, which needs no estimate; an adjusted target is a new plan with a new key.
+    if on_infeasible:
+        feasibility = estimate(input_path, target_size_mb=requested_size_mb, audio_quality=audio_quality,
+                               threads=plan.threads, preset=preset, downscale=downscale, effects=effects)
+        profiler.checkpoint('estimate')
+        if feasibility['feasible']:
+            emit('info', f"Estimate: about {feasibility['predicted_size']:.2f} MB")
+        else:
+            emit('warning', f"Estimate: {feasibility['reason']}")
+            if on_infeasible != 'adjust' or feasibility['suggested_target_size'] is None:
+                raise ValueError(f"Target not reachable: {feasibility['reason']}")
+            emit('warning', f"Target adjusted to {feasibility['suggested_target_size']:.2f} MB")
+            raise _Retry(plan._replace(target_size_mb=feasibility['suggested_target_size'], percentage=None,
+                                       on_infeasible=None), 'target_adjustments', feasibility)
+
+    # Encode under a hidden name and rename when done, so nobody ever sees a half-written output.
+    # The rename also replaces a hardlinked output instead of writing into the cache's copy.
+    partial_path = partial_path_for(output_path)
+    resumed_segments = None
+
+    on_progress = broadcast(
+        (lambda event: on_event(dict(event, type='progress'))) if on_event else None,
+        JsonLinesWriter(progress_log, input=input_path, output=output_path) if progress_log else None
+    )
+
+    monitor = MemoryMonitor(memory_limit_mb if encoder.direct_ffmpeg else None)
+    if encoder.direct_ffmpeg:
+        encoder.monitor = monitor
+
+    try:
+        monitor.start()
+        try:
+            if rate_control == 'two-pass':
+                passes = encoder.encode_two_pass(
+                    input_path,
+                    partial_path,
+                    target_size_mb * 1024 * 1024,
+                    video_bitrate,
+                    audio_bitrate,
+                    has_audio,
+                    threads=threads,
+                    preset=preset,
+                    tolerance=size_tolerance,
+                    on_progress=on_progress,
+                    duration=duration
+                )
+            elif fused:
+                generation_stats = encode_generations(
+                    encoder,
+                    input_path,
+                    partial_path,
+                    stages,
+                    has_audio,
+                    threads=threads,
+                    preset=preset,
+                    on_progress=on_progress,
+                    duration=duration,
+                    plain_video_args=plain_video_args
+                )
+            elif custom:
+                encode_frame_effects(
+                    encoder,
+                    input_path,
+                    partial_path,
+                    custom,
+                    video_bitrate,
+                    audio_bitrate,
+                    has_audio,
+                    geometry['fps'] if geometry else graph['fps'] or 25,
+                    threads=threads,
+                    preset=preset,
+                    on_progress=on_progress,
+                    duration=duration
+                )
+            elif stream_copy:
+                encoder.encode(
+                    input_path,
+                    partial_path,
+                    video_bitrate,
+                    audio_bitrate,
+                    has_audio,
+                    threads=threads,
+                    preset=preset,
+                    on_progress=on_progress,
+                    duration=duration,
+                    video_copy=streams['video'] == 'copy',
+                    audio_copy=streams['audio'] == 'copy'
+                )
+            elif segmented or resume:
+                chunks = encode_segmented(
+                    encoder,
+                    input_path,
+                    partial_path,
+                    video_bitrate,
+                    audio_bitrate,
+                    has_audio,
+                    duration,
+                    checkpoint_count(duration, segments) if resume else segments,
+                    threads=threads,
+                    preset=preset,
+                    on_progress=on_progress,
+                    workers=segments if segmented else 1,
+                    journal_dir=resume_dir_for(output_path) if resume else None
+                )
+                segments_encoded = chunks['count']
+                resumed_segments = chunks['reused']
+            else:
+                encoder.encode(
+                    input_path,
+                    partial_path,
+                    video_bitrate,
+                    audio_bitrate,
+                    has_audio,
+                    threads=threads,
+                    preset=preset,
+                    on_progress=on_progress,
+                    duration=duration
+                )
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        finally:
+            monitor.stop()
+            profiler.note_peak(monitor.peak_mb)
+    except (IOError, OSError) as e:
+        if monitor.exceeded:
+            raise MemoryError(f"The encode went over the {memory_limit_mb} MB memory ceiling and was stopped. "
+                              f"Try a higher ceiling or fewer threads.") from e
+        if "Permission denied" in str(e):
+            if retry_count < MAX_RETRIES:
+                emit('warning', "Permission error when writing file. Trying with a different filename...")
+                filename, ext = os.path.splitext(output_path)
+                new_output_path = f"{filename}_alt{retry_count+1}{ext}"
+                raise _Retry(plan._replace(output_path=new_output_path), 'permission_retries')
+            else:
+                raise PermissionError(f"Cannot write to output file after {retry_count} retries. Please check file permissions.")
+        elif "Broken pipe" in str(e):
+            if target_size_mb < 0.5 and retry_count < 2:
+                emit('warning', "Broken pipe error. This may be due to extremely low bitrate. Trying with a higher minimum size...")
+                raise _Retry(plan._replace(target_size_mb=0.5, percentage=None), 'broken_pipe_retries')
+            else:
+                emit('error', f"Broken pipe error details: {str(e)}")
+                emit('warning', "This error often occurs when the ffmpeg process is terminated unexpectedly.")
+                emit('warning', "This can happen with extremely small target sizes or permission issues.")
+                raise IOError("Broken pipe error during compression. The target size may be too small for this video or there might be a file access issue.")
+        else:
+            raise e
+
+    profiler.checkpoint('encode')
+    if passes:
+        profiler.count('second_pass_repeats', len(passes) - 1)
+
+    if not os.path.exists(partial_path) or os.path.getsize(partial_path) == 0:
+        raise IOError(f"Compression failed: Output file {output_path} is missing or empty.")
+    os.replace(partial_path, output_path)
+
+    final_size = os.path.getsize(output_path) / (1024 * 1024)
+    size_change_percent = ((final_size - original_size) / original_size) * 100
+    compression_ratio = ((original_size - final_size) / original_size) * 100
+    size_error_percent = ((final_size - target_size_mb) / target_size_mb) * 100
+    
+    emit('result', f"Original size: {original_size:.2f} MB")
+    emit('result', f"Compressed size: {final_size:.2f} MB")
+    emit('result', f"Target size: {target_size_mb:.2f} MB ({size_error_percent:+.2f}% off)")
+    if resumed_segments:
+        emit('result', f"Resumed: {resumed_segments} of {segments_encoded} chunks were already done by an earlier run")
+    if passes and len(passes) > 1:
+        emit('result', f"Second pass was repeated {len(passes) - 1} time(s) to get within tolerance")
+    if monitor.peak_mb:
+        emit('result', f"Peak memory: {monitor.peak_mb:.0f} MB{f' (ceiling {memory_limit_mb} MB)' if memory_limit_mb else ''}")
+    if generation_stats:
+        for g in generation_stats:
+            emit('result', f"  Generation {g['generation']}: {g['size'] / (1024 * 1024):.2f} MB, done after {g['seconds']:.1f}s")
+    
+    if final_size >= original_size:
+        # Size increased
+        emit('error', f"[FAIL] Size increased by {abs(size_change_percent):.2f}%")
+        emit('error', "Unable to compress this video further with current settings")
+    elif compression_ratio < 5:
+        # Minimal compression (less than 5%)
+        emit('warning', f"[WARN] Minimal reduction: {compression_ratio:.2f}%")
+        emit('warning', "Video might be already well-compressed or using efficient codec")
+    elif target_percentage is not None and (abs(target_percentage - ((final_size / original_size) * 100)) > 10):
+        # Significant deviation from target percentage
+        actual_percentage = (final_size / original_size) * 100
+        emit('warning', f"Target: {target_percentage:.2f}% of original size")
+        emit('warning', f"Actual: {actual_percentage:.2f}% of original size")
+        emit('warning', "[WARN] Could not achieve exact target percentage")
+    else:
+        # Successful compression
+        emit('success', f"[SUCCESS] Reduced by {compression_ratio:.2f}%")
+    
+    result = {
+        'original_size': original_size,
+        'final_size': final_size,
+        'compression_ratio': compression_ratio,
+        'size_increased': final_size > original_size,
+        'audio_quality': audio_quality,
+        'target_size': target_size_mb,
+        'size_error_percent': size_error_percent,
+        'rate_control': rate_control,
+        'passes': passes,
+        'segments': segments_encoded,
+        'resumed_segments': resumed_segments,
+        'estimate': feasibility,
+        'generations': generation_stats,
+        'streams': streams if stream_copy else None,
+        'geometry': geometry,
+        'effects': effect_names(effects) or None,
+        'cached': False,
+        'peak_rss_mb': monitor.peak_mb,
+        'memory_limit_mb': memory_limit_mb
+    }
+
+    profiler.checkpoint('finalize')
+
+    if cache:
+        try:
+            cache.put(key, output_path, result)
+        except Exception as e:
+            # A broken cache should never cost us the compressed video
+            emit('warning', f"Warning: Could not store the result in the cache: {e}")
+        profiler.checkpoint('cache store')
+
+    return result
+
+
+def plan_to_json(plan):
+    """A JobPlan as a JSON-able dict for a worker process; a ResultCache travels as its settings"""
+    data = plan._asdict()
+    if isinstance(plan.cache, ResultCache):
+        data['cache'] = {'cache_dir': plan.cache.cache_dir, 'max_size_mb': plan.cache.max_size / (1024 * 1024)}
+    if any(callable(effect) for effect in plan.effects or []):
+        raise ValueError("Custom frame effects can't be sent to a worker process, call compress() directly")
+    return data
+
+
+def plan_from_json(data):
+    if isinstance(data.get('cache'), dict):
+        data['cache'] = ResultCache(**data['cache'])
+    return JobPlan(**data)
+
+
+def _error_type(name):
+    error = getattr(builtins, name, None)
+    return error if isinstance(error, type) and issubclass(error, Exception) else RuntimeError
+
+
+class AsyncCompressor:
+    """Runs compress() jobs from asyncio, each in its own worker process, at most `concurrency` at once.
+    Cancelling the task of a job stops its worker and encoders and removes the partial output."""
+
+    def __init__(self, concurrency=1, stop_timeout=5.0):
+        # asyncio alone takes longer to import than the rest of this module, only load it when it's used
+        import asyncio
+
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.stop_timeout = stop_timeout
+
+    async def compress(self, plan, on_event=None):
+        """Same as compress(plan, on_event), awaitable. on_event is called from the event loop."""
+        import asyncio
+
+        payload = json.dumps(plan_to_json(plan)).encode()
+        async with self.semaphore:
+            # Own process group, so the ffmpeg processes of the worker can be stopped along with it
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), '--worker',
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                start_new_session=hasattr(os, 'killpg')
+            )
+            result = None
+            error = None
+            try:
+                process.stdin.write(payload)
+                await process.stdin.drain()
+                process.stdin.close()
+                async for line in process.stdout:
+                    event = json.loads(line)
+                    if event['type'] == 'result':
+                        result = event['result']
+                    elif event['type'] == 'error':
+                        error = event
+                    elif on_event:
+                        on_event(event)
+                await process.wait()
+            except BaseException:
+                await self._stop(process)
+                raise
+        if error:
+            raise _error_type(error['error'])(error['message'])
+        if result is None:
+            raise RuntimeError(f"The worker process exited with code {process.returncode} without a result")
+        return result
+
+    async def _stop(self, process):
+        import asyncio
+
+        if process.returncode is not None:
+            return
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            # Windows has no process groups to signal; the ffmpeg children notice their pipes closing
+            process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            if hasattr(os, 'killpg'):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            await process.wait()
+
+
+def _worker_main():
+    """python api.py --worker: reads a JobPlan as JSON on stdin, writes events and finally
+    {'type': 'result'} or {'type': 'error'} as JSON lines on stdout"""
+    out = sys.stdout
+    # Whatever else prints (MoviePy, libraries) must not end up in the event stream
+    sys.stdout = sys.stderr
+
+    def send(event):
+        out.write(json.dumps(event) + "\n")
+        out.flush()
+
+    def terminate(signum, frame):
+        # Unwinds through compress(), which removes the partial output
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        result = compress(plan_from_json(json.load(sys.stdin)), on_event=send)
+    except Exception as e:
+        send({'type': 'error', 'error': type(e).__name__, 'message': str(e)})
+        return 1
+    send({'type': 'result', 'result': result})
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['--worker']:
+        sys.exit(_worker_main())
+    print("usage: python api.py --worker (started by AsyncCompressor)", file=sys.stderr)
+    sys.exit(2)
@@ -0,0 +1,538 @@
+# headless batch mode for video shittifier
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from colorama import init, Fore, Style
+from probe import probe
+from cache import ResultCache, DEFAULT_MAX_SIZE_MB
+from scheduler import plan_batch, preset_for
+
+init()
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+
+def expand_inputs(patterns):
+    """Turn a list of files, directories and glob patterns into a list of video files.
+    Order is kept and duplicates are dropped."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if os.path.isfile(path) and os.path.abspath(path) not in [os.path.abspath(p) for p in paths]:
+                paths.append(path)
+            elif not os.path.exists(path):
+                print(f"{Fore.YELLOW}Warning: No such file: {path}{Style.RESET_ALL}")
+    return paths
+
+
+def output_path_for(input_path, output_dir=None):
+    """Same naming as the interactive mode: <name>_compressed<ext>"""
+    filename, ext = os.path.splitext(input_path)
+    if output_dir:
+        filename = os.path.join(output_dir, os.path.basename(filename))
+    return filename + "_compressed" + ext
+
+
+def check_output_paths(input_paths, output_dir=None):
+    """ValueError if two inputs would be written to the same file, e.g. a/x.mp4 and b/x.mp4 with one output_dir"""
+    seen = {}
+    for path in input_paths:
+        output_path = os.path.normcase(os.path.abspath(output_path_for(path, output_dir)))
+        if output_path in seen:
+            raise ValueError(f"{seen[output_path]} and {path} would both be written to "
+                             f"{output_path_for(path, output_dir)}")
+        seen[output_path] = path
+
+
+def parse_audio_quality(value):
+    """-a/--audio-quality, see api.parse_audio_quality"""
+    from api import parse_audio_quality
+
+    try:
+        return parse_audio_quality(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_renditions(value):
+    """Comma-separated rendition list for --renditions, e.g. '8,25MB,50%:l'"""
+    from renditions import parse_rendition, check_renditions
+
+    renditions = []
+    try:
+        for item in value.split(','):
+            # '8' and '8MB' are the same rendition, only encode it once
+            if item.strip() and parse_rendition(item) not in renditions:
+                renditions.append(parse_rendition(item))
+        check_renditions(renditions)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return renditions
+
+
+def parse_effect_list(value):
+    """Effect list for --effects, e.g. 'deepfry,crush=2'"""
+    from effects import parse_effects
+
+    try:
+        return parse_effects(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def run_job(input_path, output_path, **options):
+    """Run one api.compress() job quietly and wrap it in an outcome dict
+    ({'input', 'output', 'result', 'error', 'elapsed'}). Its messages are collected so parallel
+    jobs don't scribble over each other; they are only kept (as 'log') when the job fails."""
+    from api import JobPlan, compress
+
+    started = time.time()
+    messages = []
+
+    def collect(event):
+        if event['type'] == 'message':
+            messages.append(event['text'])
+
+    outcome = {'input': input_path, 'output': output_path, 'result': None, 'error': None}
+    try:
+        outcome['result'] = compress(JobPlan(input_path, output_path, **options), collect)
+    except Exception as e:
+        outcome['error'] = str(e)
+        outcome['log'] = "\n".join(messages)
+    outcome['elapsed'] = time.time() - started
+    return outcome
+
+
+def _compress_job(job):
+    """Runs inside a worker process"""
+    return run_job(job['input_path'], job['output_path'], **job['options'])
+
+
+def _probe_or_none(path):
+    try:
+        return probe(path)
+    except Exception:
+        return None
+
+
+def compress_batch(input_paths, percentage=None, target_size_mb=None, audio_quality='medium',
+                   workers=None, threads=None, output_dir=None, engine='auto', rate_control='single', size_tolerance=5.0,
+                   segments=None, cache=None, generations=1, progress_log=None, preset='medium', memory_limit_mb=None,
+                   resume=False, estimates=None, on_infeasible=None, downscale=True, effects=None,
+                   profile=False, metrics_path=None, on_done=None):
+    """Compress every file in input_paths using a bounded pool of worker processes.
+    workers/threads left as None are picked by the scheduler from the free CPUs and the clips.
+    estimates ({input_path: estimate dict}, see estimate.estimate_batch) order the jobs by their predicted
+    encode time, and with on_infeasible='reject' or 'adjust' unreachable targets are dropped or raised
+    before anything is encoded.
+    profile adds a profile to every result (see metrics.py); metrics_path writes them out: every job
+    appends its own JSON line, a .prom file is written once at the end with the jobs that finished.
+    Returns one outcome dict per input, in input order."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from metrics import is_prometheus, write_metrics
+
+    check_output_paths(input_paths, output_dir)
+    infos = [_probe_or_none(path) for path in input_paths]
+    plan = plan_batch(infos, jobs=workers, threads=threads, memory_limit_mb=memory_limit_mb)
+    workers = plan['workers']
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    jobs = [{
+        'input_path': path,
+        'output_path': output_path_for(path, output_dir),
+        'duration': info.duration if info else 0,
+        'options': {
+            'percentage': percentage,
+            'target_size_mb': target_size_mb,
+            'audio_quality': audio_quality,
+            'threads': job_threads,
+            'preset': preset,
+            'engine': engine,
+            'rate_control': rate_control,
+            'size_tolerance': size_tolerance,
+            'segments': segments,
+            'cache': cache,
+            'generations': generations,
+            'progress_log': progress_log,
+            'memory_limit_mb': memory_limit_mb,
+            'resume': resume,
+            'downscale': downscale,
+            'effects': effects,
+            'profile': profile or bool(metrics_path),
+            # One process has to write the whole .prom file
+            'metrics_path': metrics_path if metrics_path and not is_prometheus(metrics_path) else None,
+        },
+    } for path, info, job_threads in zip(input_paths, infos, plan['threads'])]
+
+    outcomes = {}
+    if estimates:
+        for job in list(jobs):
+            guess = estimates.get(job['input_path']) or {}
+            if guess.get('predicted_seconds'):
+                job['duration'] = guess['predicted_seconds']
+            if not on_infeasible or guess.get('feasible', True):
+                continue
+            if on_infeasible == 'adjust' and guess['suggested_target_size'] is not None:
+                job['options'].update(target_size_mb=guess['suggested_target_size'], percentage=None)
+                continue
+            jobs.remove(job)
+            outcomes[job['input_path']] = {'input': job['input_path'], 'output': None, 'result': None,
+                                           'error': f"Target not reachable: {guess['reason']}", 'elapsed': 0}
+            if on_done:
+                on_done(outcomes[job['input_path']])
+
+    # Longest jobs first (by predicted encode time if there are estimates, otherwise by length),
+    # so one big file doesn't start last and hold up the whole batch
+    jobs.sort(key=lambda job: job['duration'], reverse=True)
+
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        futures = {pool.submit(_compress_job, job): job['input_path'] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                # The worker process itself died (killed, out of memory...)
+                outcome = {'input': futures[future], 'output': None, 'result': None, 'error': str(e), 'elapsed': 0}
+            outcomes[outcome['input']] = outcome
+            if on_done:
+                on_done(outcome)
+    outcomes = [outcomes[path] for path in input_paths]
+    if metrics_path and is_prometheus(metrics_path):
+        write_metrics(metrics_path, [({'input': o['input'], 'output': o['output']}, o['result']['profile'])
+                                     for o in outcomes if o['result']])
+    return outcomes
+
+
+def print_summary(outcomes):
+    """Print a table of the per-file result dicts"""
+    name_width = max([len(os.path.basename(o['input'])) for o in outcomes] + [4])
+    header = f"{'File':<{name_width}}  {'Original':>10}  {'Final':>10}  {'Reduced':>8}  {'Off target':>10}  {'Time':>8}  Status"
+    print(f"\n{Fore.GREEN}{header}{Style.RESET_ALL}")
+    print("-" * (len(header) + 10))
+    for o in outcomes:
+        name = os.path.basename(o['input'])
+        result = o['result']
+        if result is None:
+            print(f"{Fore.RED}{name:<{name_width}}  {'-':>10}  {'-':>10}  {'-':>8}  {'-':>10}  {o['elapsed']:>7.1f}s  FAIL: {o['error']}{Style.RESET_ALL}")
+            continue
+        status = 'SIZE INCREASED' if result['size_increased'] else 'OK'
+        if result.get('cached'):
+            status += ' (cached)'
+        color = Fore.YELLOW if result['size_increased'] else Fore.CYAN
+        print(f"{color}{name:<{name_width}}  {result['original_size']:>8.2f}MB  {result['final_size']:>8.2f}MB  "
+              f"{result['compression_ratio']:>7.2f}%  {result['size_error_percent']:>+9.2f}%  {o['elapsed']:>7.1f}s  {status}{Style.RESET_ALL}")
+
+    failed = sum(1 for o in outcomes if o['result'] is None)
+    print(f"\n{Fore.CYAN}{len(outcomes) - failed}/{len(outcomes)} files compressed{Style.RESET_ALL}")
+
+
+def print_profiles(outcomes):
+    """Print where the time of every job went, from the profiles in the results"""
+    for o in outcomes:
+        profile = (o['result'] or {}).get('profile')
+        if not profile:
+            continue
+        peak = f", peak {profile['peak_rss_mb']:.0f} MB" if profile['peak_rss_mb'] else ''
+        print(f"\n{Fore.CYAN}{os.path.basename(o['input'])}: {profile['wall_seconds']:.2f}s, CPU "
+              f"{profile['cpu_seconds']:.2f}s here and {profile['child_cpu_seconds']:.2f}s in ffmpeg{peak}{Style.RESET_ALL}")
+        for name, stage in profile['stages'].items():
+            calls = f" ({stage['calls']}x)" if stage['calls'] > 1 else ''
+            print(f"  {name:<24}{stage['seconds']:>8.2f}s{calls}")
+        for name, count in profile['counters'].items():
+            print(f"{Fore.YELLOW}  {name}: {count}{Style.RESET_ALL}")
+
+
+def print_estimates(estimates):
+    """Print a table of estimate dicts"""
+    name_width = max([len(os.path.basename(e['input'])) for e in estimates] + [4])
+    header = f"{'File':<{name_width}}  {'Original':>10}  {'Target':>10}  {'Predicted':>10}  {'Time':>8}  Verdict"
+    print(f"\n{Fore.GREEN}{header}{Style.RESET_ALL}")
+    print("-" * (len(header) + 10))
+    for e in estimates:
+        name = os.path.basename(e['input'])
+        if 'error' in e:
+            print(f"{Fore.RED}{name:<{name_width}}  {'-':>10}  {'-':>10}  {'-':>10}  {'-':>8}  FAIL: {e['error']}{Style.RESET_ALL}")
+            continue
+        seconds = f"{e['predicted_seconds']:.0f}s" if e['predicted_seconds'] is not None else '?'
+        if e['feasible']:
+            color, verdict = Fore.CYAN, 'OK'
+        elif e['suggested_target_size'] is not None:
+            color, verdict = Fore.YELLOW, f"{e['reason']} (try {e['suggested_target_size']:.2f} MB)"
+        else:
+            color, verdict = Fore.RED, e['reason']
+        print(f"{color}{name:<{name_width}}  {e['original_size']:>8.2f}MB  {e['target_size']:>8.2f}MB  "
+              f"{e['predicted_size']:>8.2f}MB  {seconds:>8}  {verdict}{Style.RESET_ALL}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Compress many videos without the interactive prompts."
+    )
+    parser.add_argument('inputs', nargs='+', help="video files, directories or glob patterns (e.g. \"clips/*.mp4\"), "
+                                                  "or - to read one video from stdin and write it to stdout")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('-p', '--percentage', type=float, help="target percentage of the original size (0-100)")
+    mode.add_argument('-t', '--target-size', type=float, help="target size in MB")
+    mode.add_argument('--renditions', type=parse_renditions,
+                      help="several outputs from one decode: comma-separated targets in MB or percent, each "
+                           "optionally with its own audio quality (e.g. 8,25,50%%:l)")
+    parser.add_argument('-a', '--audio-quality', type=parse_audio_quality, default='medium',
+                        help="h/m/l/v or a 1-100 custom percentage of the total bitrate (default: medium)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of files to compress at the same time (default: picked from free CPUs and clip sizes)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="encoder threads per job (default: picked per clip from its resolution)")
+    parser.add_argument('--speed', default='balanced',
+                        help="speed/quality trade-off: fastest, faster, fast, balanced, quality, best "
+                             "or an x264 preset name (default: balanced)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the scheduler's decisions")
+    parser.add_argument('--engine', choices=['auto', 'ffmpeg', 'moviepy'], default='auto',
+                        help="encode backend (default: auto, ffmpeg directly if available)")
+    parser.add_argument('--two-pass', action='store_true',
+                        help="size-accurate two-pass encode (needs ffmpeg)")
+    parser.add_argument('--tolerance', type=float, default=5.0,
+                        help="with --two-pass, how far (in %%) the output may land from the target size (default: 5)")
+    parser.add_argument('--segments', type=int, default=None,
+                        help="split each video at keyframes into this many chunks and encode them in parallel")
+    parser.add_argument('-g', '--generations', type=int, default=1,
+                        help="compress the result again this many times in total, all in one pipeline (default: 1)")
+    parser.add_argument('--cache-dir', help="reuse outputs of earlier runs with the same file and settings "
+                                            "(default: $SHITTIFIER_CACHE_DIR if set, otherwise no cache)")
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_MAX_SIZE_MB,
+                        help=f"cache size limit in MB, least recently used outputs are dropped first (default: {DEFAULT_MAX_SIZE_MB})")
+    parser.add_argument('--no-cache', action='store_true', help="don't use the cache even if $SHITTIFIER_CACHE_DIR is set")
+    parser.add_argument('--progress-log', help="append encoder progress events (frames, fps, speed, size, ETA) "
+                                               "for every job to this JSON-lines file")
+    parser.add_argument('--profile', action='store_true',
+                        help="time every stage of every job and count its retries and fallbacks, printed after the summary")
+    parser.add_argument('--metrics', help="write those profiles (timings, retries, fallbacks, CPU time, peak memory) to "
+                                          "this file: Prometheus text format if it ends in .prom, JSON lines otherwise")
+    parser.add_argument('--resume', action='store_true',
+                        help="checkpoint the encode in chunks next to the output, so a rerun after a crash "
+                             "continues where it stopped")
+    parser.add_argument('--effects', type=parse_effect_list,
+                        help="degradation effects applied during the encode, comma-separated, each optionally with a "
+                             "strength: blocky[=8], crush[=3], drop[=8], deepfry[=1], bitcrush[=4], samplerate[=8000]")
+    parser.add_argument('--no-downscale', dest='downscale', action='store_false',
+                        help="keep the source resolution and frame rate even when the bitrate is far too low for them")
+    parser.add_argument('--estimate', action='store_true',
+                        help="only predict output size and encode time from a few short sample encodes, don't compress")
+    parser.add_argument('--on-infeasible', choices=['adjust', 'reject'],
+                        help="check every target with sample encodes first; raise unreachable targets to what can "
+                             "be reached, or skip those files. Longest predicted encodes start first")
+    parser.add_argument('--memory-limit', type=float, default=None,
+                        help="memory ceiling per job in MB; encoder buffers are sized to fit, the job is stopped if it "
+                             "goes over, and fewer jobs run at once if memory is short")
+    parser.add_argument('-o', '--output-dir', help="write outputs here instead of next to the inputs")
+    stream = parser.add_argument_group("streaming (input -)")
+    stream.add_argument('--format', choices=['mp4', 'mkv'], default='mp4',
+                        help="container written to stdout: fragmented MP4 or Matroska (default: mp4)")
+    stream.add_argument('--size-hint', type=int, help="input size in bytes, when the stream can't tell")
+    stream.add_argument('--duration-hint', type=float, help="input duration in seconds, when the stream can't tell")
+    return parser
+
+
+def run_stream(args):
+    """Pipe mode: stdout carries the video, so everything else goes to stderr"""
+    from progress import ConsoleProgress, JsonLinesWriter, broadcast
+    from stream import compress_stream
+
+    if sys.stdout.isatty():
+        print(f"{Fore.RED}Refusing to write video to a terminal, redirect stdout to a file or pipe.{Style.RESET_ALL}",
+              file=sys.stderr)
+        return 1
+    console = ConsoleProgress(stream=sys.stderr) if sys.stderr.isatty() else None
+    on_progress = broadcast(console, JsonLinesWriter(args.progress_log, input='-') if args.progress_log else None)
+    sys.stdout.flush()
+    try:
+        result = compress_stream(
+            sys.stdin.fileno(), sys.stdout.fileno(),
+            target_size_mb=args.target_size,
+            percentage=args.percentage,
+            audio_quality=args.audio_quality,
+            threads=args.threads,
+            preset=preset_for(args.speed),
+            output_format=args.format,
+            size_hint=args.size_hint,
+            duration_hint=args.duration_hint,
+            downscale=args.downscale,
+            on_progress=on_progress
+        )
+    except Exception as e:
+        print(f"{Fore.RED}[FAIL] {e}{Style.RESET_ALL}", file=sys.stderr)
+        return 1
+    finally:
+        if console:
+            console.close()
+    print(f"{Fore.GREEN}[DONE] {result['final_size']:.2f}MB written "
+          f"(target {result['target_size']:.2f}MB, {result['size_error_percent']:+.1f}%){Style.RESET_ALL}", file=sys.stderr)
+    return 0
+
+
+def run_renditions(input_paths, args, preset):
+    """--renditions: every input is decoded once and encoded to all renditions at the same time"""
+    from main import LEVEL_COLORS
+    from renditions import compress_renditions, rendition_label
+
+    def on_event(event):
+        if event['type'] == 'message':
+            print(f"{LEVEL_COLORS[event['level']]}{event['text']}{Style.RESET_ALL}")
+
+    outcomes = []
+    for input_path in input_paths:
+        print(f"{Fore.BLUE}{os.path.basename(input_path)}: {len(args.renditions)} renditions{Style.RESET_ALL}")
+        started = time.time()
+        try:
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+            results = compress_renditions(input_path, output_path_for(input_path, args.output_dir), args.renditions,
+                                          audio_quality=args.audio_quality, threads=args.threads, preset=preset,
+                                          on_event=on_event, progress_log=args.progress_log,
+                                          downscale=args.downscale)
+        except Exception as e:
+            results = [None] * len(args.renditions)
+            error = str(e)
+        elapsed = time.time() - started
+        for rendition, result in zip(args.renditions, results):
+            outcomes.append({'input': f"{input_path} [{rendition_label(rendition)}]",
+                             'output': result['output_path'] if result else None, 'result': result,
+                             'error': None if result else error, 'elapsed': elapsed})
+    print_summary(outcomes)
+    return 0 if all(o['result'] is not None for o in outcomes) else 1
+
+
+def run_cli(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.percentage is not None and not 0 < args.percentage < 100:
+        parser.error("percentage must be between 0 and 100")
+    if args.target_size is not None and args.target_size <= 0:
+        parser.error("target size must be greater than 0")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.threads is not None and args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.generations < 1:
+        parser.error("--generations must be at least 1")
+    if args.tolerance <= 0:
+        parser.error("--tolerance must be greater than 0")
+    if args.memory_limit is not None and args.memory_limit <= 0:
+        parser.error("--memory-limit must be greater than 0")
+
+    try:
+        preset = preset_for(args.speed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format=f"{Fore.BLUE}[%(name)s] %(message)s{Style.RESET_ALL}")
+
+    if args.renditions is not None:
+        if not args.renditions:
+            parser.error("--renditions needs at least one target")
+        if args.two_pass or args.segments or args.generations > 1 or args.resume or args.estimate or args.on_infeasible:
+            parser.error("--renditions can't be combined with --two-pass, --segments, --generations, --resume, "
+                         "--estimate or --on-infeasible")
+        if args.effects or args.memory_limit or args.profile or args.metrics:
+            parser.error("--renditions can't be combined with --effects, --memory-limit, --profile or --metrics")
+
+    if args.inputs == ['-']:
+        if args.renditions is not None:
+            parser.error("--renditions needs files, not a stream")
+        if args.two_pass or args.segments or args.generations > 1 or args.resume:
+            parser.error("--two-pass, --segments, --generations and --resume need a seekable file, not a stream")
+        if args.estimate or args.on_infeasible:
+            parser.error("--estimate and --on-infeasible need a seekable file, not a stream")
+        if args.effects or args.memory_limit or args.profile or args.metrics:
+            parser.error("--effects, --memory-limit, --profile and --metrics are not available for streams")
+        return run_stream(args)
+
+    input_paths = expand_inputs(args.inputs)
+    if not input_paths:
+        print(f"{Fore.RED}No input files found.{Style.RESET_ALL}")
+        return 1
+    try:
+        check_output_paths(input_paths, args.output_dir)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.renditions is not None:
+        return run_renditions(input_paths, args, preset)
+
+    cache = None
+    if args.no_cache:
+        cache = False
+    elif args.cache_dir or os.environ.get('SHITTIFIER_CACHE_DIR'):
+        cache = ResultCache(args.cache_dir, max_size_mb=args.cache_size)
+
+    estimates = None
+    if args.estimate or args.on_infeasible:
+        from estimate import estimate_batch
+        from scheduler import free_cpus
+        print(f"{Fore.BLUE}Estimating {len(input_paths)} file(s)...{Style.RESET_ALL}")
+        estimates = estimate_batch(input_paths, workers=free_cpus(), target_size_mb=args.target_size,
+                                   percentage=args.percentage, audio_quality=args.audio_quality,
+                                   threads=args.threads, preset=preset, downscale=args.downscale,
+                                   effects=args.effects)
+        if args.estimate:
+            print_estimates([estimates[path] for path in input_paths])
+            return 0 if all(e.get('feasible') for e in estimates.values()) else 1
+
+    print(f"{Fore.BLUE}Compressing {len(input_paths)} file(s)...{Style.RESET_ALL}")
+
+    def report(outcome):
+        name = os.path.basename(outcome['input'])
+        if outcome['result'] is None:
+            print(f"{Fore.RED}[FAIL] {name}: {outcome['error']}{Style.RESET_ALL}")
+        else:
+            print(f"{Fore.GREEN}[DONE] {name} -> {outcome['output']}{Style.RESET_ALL}")
+
+    outcomes = compress_batch(
+        input_paths,
+        percentage=args.percentage,
+        target_size_mb=args.target_size,
+        audio_quality=args.audio_quality,
+        workers=args.jobs,
+        threads=args.threads,
+        preset=preset,
+        output_dir=args.output_dir,
+        engine=args.engine,
+        rate_control='two-pass' if args.two_pass else 'single',
+        size_tolerance=args.tolerance,
+        segments=args.segments,
+        cache=cache,
+        generations=args.generations,
+        progress_log=args.progress_log,
+        memory_limit_mb=args.memory_limit,
+        resume=args.resume,
+        estimates=estimates,
+        on_infeasible=args.on_infeasible,
+        downscale=args.downscale,
+        effects=args.effects,
+        profile=args.profile,
+        metrics_path=args.metrics,
+        on_done=report
+    )
+    print_summary(outcomes)
+    if args.profile:
+        print_profiles(outcomes)
+    return 0 if all(o['result'] is not None for o in outcomes) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -0,0 +1,74 @@
+# compare encode speed of the moviepy and ffmpeg backends on the same input
+#
+# usage: python benchmarks/engine_speed.py input.mp4 [--bitrate 500k] [--audio-bitrate 64k] [--threads 2] [--runs 1]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engines import ENGINES
+from probe import find_ffprobe, probe
+
+
+def count_frames(path):
+    """Count video frames with ffprobe (packet count, no decoding needed)"""
+    ffprobe = find_ffprobe() or 'ffprobe'
+    output = subprocess.check_output([
+        ffprobe, '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+        '-show_entries', 'stream=nb_read_packets:format=duration', '-of', 'json', path
+    ])
+    info = json.loads(output)
+    return int(info['streams'][0]['nb_read_packets'])
+
+
+def run(input_path, video_bitrate, audio_bitrate, threads, runs):
+    frames = count_frames(input_path)
+    has_audio = probe(input_path).has_audio
+    _, ext = os.path.splitext(input_path)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, engine_class in ENGINES.items():
+            engine = engine_class()
+            times = []
+            for i in range(runs):
+                output_path = os.path.join(tmp, f"{name}_{i}{ext}")
+                started = time.perf_counter()
+                engine.encode(input_path, output_path, video_bitrate, audio_bitrate, has_audio, threads=threads)
+                times.append(time.perf_counter() - started)
+            best = min(times)
+            results[name] = {
+                'seconds': best,
+                'fps': frames / best,
+                'output_mb': os.path.getsize(output_path) / (1024 * 1024),
+            }
+    return frames, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames/sec of each encode backend on the same input")
+    parser.add_argument('input')
+    parser.add_argument('--bitrate', default='500k', help="video bitrate (default: 500k)")
+    parser.add_argument('--audio-bitrate', default='64k', help="audio bitrate (default: 64k)")
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--runs', type=int, default=1, help="runs per engine, the fastest one is reported")
+    args = parser.parse_args()
+
+    frames, results = run(args.input, args.bitrate, args.audio_bitrate, args.threads, args.runs)
+
+    print(f"{os.path.basename(args.input)}: {frames} frames, video {args.bitrate}, audio {args.audio_bitrate}, threads {args.threads}")
+    print(f"{'engine':<10}{'seconds':>10}{'fps':>10}{'size MB':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['seconds']:>10.2f}{r['fps']:>10.1f}{r['output_mb']:>10.2f}")
+    if 'moviepy' in results and 'ffmpeg' in results:
+        print(f"\nffmpeg speedup: {results['moviepy']['seconds'] / results['ffmpeg']['seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
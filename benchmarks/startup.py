@@ -0,0 +1,101 @@
+# startup time benchmark for video shittifier
+#
+# Every scripted run pays for the imports before anything else happens. This starts each entry
+# point in a fresh interpreter a number of times, takes the fastest run, subtracts what a bare
+# `python -c pass` takes, and compares that against a budget. It also checks that the headless
+# paths don't load modules only the interactive mode or the MoviePy engine need.
+#
+# usage:
+#   python benchmarks/startup.py                     (default budget)
+#   python benchmarks/startup.py --budget-ms 60 --runs 20 -o startup.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds on top of the bare interpreter
+DEFAULT_BUDGET_MS = 80
+
+CASES = {
+    'main.py --help': ['main.py', '--help'],
+    'batch.py --help': ['batch.py', '--help'],
+    'import api': ['-c', 'import api'],
+    'import main': ['-c', 'import main'],
+}
+
+# Never needed to start up headless: tkinter is for the file picker, the rest comes with MoviePy
+HEAVY_MODULES = ['tkinter', 'moviepy', 'numpy', 'imageio', 'proglog', 'asyncio']
+
+# Loads what a headless batch run loads before its first encode, then lists the heavy modules that came along
+HEADLESS_CHECK = (
+    "import sys, main, batch, api; batch.build_parser(); "
+    f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+)
+
+
+def time_command(args, runs):
+    """Fastest of `runs` wall times (ms) of python <args>, run from the repo root"""
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def heavy_modules_loaded():
+    output = subprocess.run([sys.executable, '-c', HEADLESS_CHECK], cwd=ROOT, capture_output=True, text=True,
+                            check=True).stdout.strip()
+    return [m for m in output.split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the entry points against a budget")
+    parser.add_argument('--runs', type=int, default=10, help="runs per entry point, the fastest one counts (default: 10)")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"allowed milliseconds on top of a bare interpreter (default: {DEFAULT_BUDGET_MS})")
+    parser.add_argument('-o', '--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    bare = time_command(['-c', 'pass'], args.runs)
+    print(f"bare interpreter: {bare:.1f} ms, budget {args.budget_ms:.0f} ms on top of that\n")
+    print(f"{'entry point':<20}{'total':>10}{'startup':>10}  status")
+    results = []
+    for name, case_args in CASES.items():
+        total = time_command(case_args, args.runs)
+        startup = total - bare
+        ok = startup <= args.budget_ms
+        results.append({'case': name, 'total_ms': total, 'startup_ms': startup, 'ok': ok})
+        print(f"{name:<20}{total:>8.1f}ms{startup:>8.1f}ms  {'OK' if ok else 'OVER BUDGET'}")
+
+    heavy = heavy_modules_loaded()
+    print(f"\nheavy modules loaded headless: {', '.join(heavy) if heavy else 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'environment': {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'platform': platform.platform(),
+                    'python': platform.python_version(),
+                },
+                'bare_ms': bare,
+                'budget_ms': args.budget_ms,
+                'results': results,
+                'heavy_modules': heavy,
+            }, f, indent=1)
+        print(f"Results written to {args.output}")
+
+    return 0 if all(r['ok'] for r in results) and not heavy else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
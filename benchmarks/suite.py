@@ -0,0 +1,240 @@
+# reproducible benchmark suite for compress_video
+#
+# Generates deterministic test clips offline with ffmpeg's lavfi sources (testsrc2/smptebars + sine),
+# runs every clip through each mode, audio quality preset, thread count and engine, and records
+# encode fps, wall time, peak RSS and how far the output landed from the target size.
+#
+# usage:
+#   python benchmarks/suite.py run -o results.json            (quick matrix)
+#   python benchmarks/suite.py run --full -o results.json     (everything)
+#   python benchmarks/suite.py compare old.json new.json
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from engines import FFmpegEngine, find_ffmpeg
+
+QUICK_MATRIX = {
+    'resolutions': ['426x240', '1280x720'],
+    'durations': [5],
+    'audio': [True, False],
+    'motion': ['low', 'high'],
+    'modes': ['P30', 'T1'],
+    'audio_qualities': ['medium'],
+    'threads': [2],
+    'engines': ['ffmpeg'],
+}
+
+FULL_MATRIX = {
+    'resolutions': ['426x240', '1280x720', '1920x1080'],
+    'durations': [5, 30],
+    'audio': [True, False],
+    'motion': ['low', 'high'],
+    'modes': ['P30', 'P10', 'T1', 'T5'],
+    'audio_qualities': ['high', 'medium', 'low', 'very-low'],
+    'threads': [1, 2, 4],
+    'engines': ['ffmpeg', 'moviepy'],
+}
+
+# low motion: static colour bars, high motion: moving test pattern with temporal noise on top
+MOTION_SOURCES = {
+    'low': 'smptebars=size={size}:rate=30',
+    'high': 'testsrc2=size={size}:rate=30,noise=alls=30:allf=t+u:all_seed=1234',
+}
+
+
+def clip_name(resolution, duration, audio, motion):
+    return f"{motion}_{resolution}_{duration}s_{'audio' if audio else 'mute'}.mp4"
+
+
+def generate_clip(clips_dir, resolution, duration, audio, motion):
+    """Render a test clip once; later runs reuse it. Single-threaded bitexact encode so the bytes
+    are the same on every machine with the same ffmpeg build."""
+    path = os.path.join(clips_dir, clip_name(resolution, duration, audio, motion))
+    if os.path.exists(path):
+        return path
+    cmd = FFmpegEngine().base_command() + ['-f', 'lavfi', '-i', MOTION_SOURCES[motion].format(size=resolution)]
+    if audio:
+        cmd += ['-f', 'lavfi', '-i', 'sine=frequency=440:beep_factor=4:sample_rate=44100']
+    cmd += ['-t', str(duration), '-c:v', 'libx264', '-crf', '18', '-preset', 'fast', '-threads', '1',
+            '-pix_fmt', 'yuv420p', '-bitexact']
+    if audio:
+        cmd += ['-c:a', 'aac', '-b:a', '192k']
+    tmp_path = path + '.tmp.mp4'
+    cmd += [tmp_path]
+    subprocess.run(cmd, check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_case(case):
+    """Runs in a fresh child process so peak RSS belongs to this case alone"""
+    import resource
+    from main import compress_video
+    from probe import probe
+
+    info = probe(case['clip'])
+    mode = case['mode']
+    kwargs = {'percentage': float(mode[1:])} if mode[0] == 'P' else {'target_size_mb': float(mode[1:])}
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, 'out.mp4')
+        started = time.perf_counter()
+        cpu_started = os.times()
+        result = compress_video(case['clip'], output_path, audio_quality=case['audio_quality'],
+                                threads=case['threads'], engine=case['engine'], show_progress=False,
+                                cache=False, **kwargs)
+        wall = time.perf_counter() - started
+        cpu = os.times()
+    frames = int(round((info.fps or 0) * info.duration))
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == 'darwin':
+        peak_kb //= 1024  # bytes on macOS
+    return {
+        'wall_seconds': wall,
+        'cpu_seconds': (cpu.children_user + cpu.children_system + cpu.user + cpu.system)
+                       - (cpu_started.children_user + cpu_started.children_system + cpu_started.user + cpu_started.system),
+        'fps': frames / wall if wall else None,
+        'peak_rss_mb': peak_kb / 1024,
+        'final_size_mb': result['final_size'],
+        'target_size_mb': result['target_size'],
+        'size_error_percent': result['size_error_percent'],
+    }
+
+
+def build_cases(matrix, clips_dir):
+    cases = []
+    for resolution, duration, audio, motion in itertools.product(
+            matrix['resolutions'], matrix['durations'], matrix['audio'], matrix['motion']):
+        clip = generate_clip(clips_dir, resolution, duration, audio, motion)
+        for mode, audio_quality, threads, engine in itertools.product(
+                matrix['modes'], matrix['audio_qualities'], matrix['threads'], matrix['engines']):
+            if not audio and audio_quality != matrix['audio_qualities'][0]:
+                continue  # audio quality makes no difference without an audio track
+            cases.append({
+                'id': f"{os.path.splitext(os.path.basename(clip))[0]}|{mode}|{audio_quality}|t{threads}|{engine}",
+                'clip': clip,
+                'mode': mode,
+                'audio_quality': audio_quality,
+                'threads': threads,
+                'engine': engine,
+            })
+    return cases
+
+
+def environment():
+    version = subprocess.run([find_ffmpeg(), '-version'], capture_output=True, text=True).stdout.splitlines()
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': version[0] if version else None,
+    }
+
+
+def command_run(args):
+    matrix = dict(FULL_MATRIX if args.full else QUICK_MATRIX)
+    for name in ('resolutions', 'modes', 'audio_qualities', 'engines'):
+        if getattr(args, name):
+            matrix[name] = getattr(args, name).split(',')
+    if args.threads:
+        matrix['threads'] = [int(t) for t in args.threads.split(',')]
+
+    os.makedirs(args.clips_dir, exist_ok=True)
+    cases = build_cases(matrix, args.clips_dir)
+    print(f"{len(cases)} cases")
+
+    results = []
+    for i, case in enumerate(cases, 1):
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), 'case', json.dumps(case)],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            entry = dict(case, error=process.stderr.strip().splitlines()[-1:] or ['failed'])
+            print(f"[{i}/{len(cases)}] {case['id']}: FAILED")
+        else:
+            entry = dict(case, **json.loads(process.stdout.strip().splitlines()[-1]))
+            print(f"[{i}/{len(cases)}] {case['id']}: {entry['fps']:.1f} fps, {entry['wall_seconds']:.2f}s, "
+                  f"{entry['peak_rss_mb']:.0f} MB RSS, {entry['size_error_percent']:+.1f}% off target")
+        entry['clip'] = os.path.basename(entry['clip'])
+        results.append(entry)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=1)
+    print(f"Results written to {args.output}")
+
+
+def command_case(args):
+    # Everything compress_video prints goes to stderr, stdout is kept for the JSON result
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    result = run_case(json.loads(args.case))
+    sys.stdout = stdout
+    print(json.dumps(result))
+
+
+def command_compare(args):
+    with open(args.old) as f:
+        old = {r['id']: r for r in json.load(f)['results'] if 'error' not in r}
+    with open(args.new) as f:
+        new = {r['id']: r for r in json.load(f)['results'] if 'error' not in r}
+
+    print(f"{'case':<58}{'fps old':>9}{'fps new':>9}{'change':>9}{'err old':>9}{'err new':>9}")
+    speedups = []
+    for case_id in sorted(old.keys() & new.keys()):
+        a, b = old[case_id], new[case_id]
+        change = (b['fps'] / a['fps'] - 1) * 100 if a['fps'] else 0
+        speedups.append(b['fps'] / a['fps'] if a['fps'] else 1)
+        print(f"{case_id:<58}{a['fps']:>9.1f}{b['fps']:>9.1f}{change:>+8.1f}%"
+              f"{a['size_error_percent']:>+8.1f}%{b['size_error_percent']:>+8.1f}%")
+    if speedups:
+        geomean = 1.0
+        for s in speedups:
+            geomean *= s
+        geomean **= 1 / len(speedups)
+        print(f"\n{len(speedups)} cases compared, geometric mean fps change: {(geomean - 1) * 100:+.1f}%")
+    missing = old.keys() ^ new.keys()
+    if missing:
+        print(f"{len(missing)} cases only in one of the files")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compress_video on generated test clips")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help="generate clips and run the benchmark matrix")
+    run.add_argument('-o', '--output', default='bench_results.json')
+    run.add_argument('--clips-dir', default=os.path.join(tempfile.gettempdir(), 'shittifier_bench_clips'))
+    run.add_argument('--full', action='store_true', help="run the full matrix instead of the quick one")
+    run.add_argument('--resolutions', help="comma separated, e.g. 426x240,1920x1080")
+    run.add_argument('--modes', help="comma separated, P<percent> or T<MB>, e.g. P30,T8")
+    run.add_argument('--audio-qualities', help="comma separated, e.g. high,very-low")
+    run.add_argument('--threads', help="comma separated, e.g. 1,2,4")
+    run.add_argument('--engines', help="comma separated, e.g. ffmpeg,moviepy")
+    run.set_defaults(func=command_run)
+
+    case = sub.add_parser('case', help=argparse.SUPPRESS)
+    case.add_argument('case')
+    case.set_defaults(func=command_case)
+
+    compare = sub.add_parser('compare', help="compare two results files")
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
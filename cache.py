@@ -0,0 +1,171 @@
+# on-disk result cache for video shittifier
+#
+# Outputs are stored under a key made from a fast content hash of the input plus the normalized
+# compression parameters and the engine version. index.json keeps the result dict of every entry and
+# when it was last used; the least recently used entries are evicted once the cache grows past its
+# size limit.
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from engines import ENGINE_VERSION
+
+DEFAULT_MAX_SIZE_MB = 2048
+SAMPLE_SIZE = 1024 * 1024
+
+
+def default_cache_dir():
+    return os.environ.get('SHITTIFIER_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'video-shittifier')
+
+
+def content_hash(path):
+    """Hash the file size plus 1 MiB from the start, middle and end of the file.
+    Much faster than hashing everything, and still changes whenever the video is re-exported."""
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - SAMPLE_SIZE // 2), max(0, size - SAMPLE_SIZE)}):
+            f.seek(offset)
+            digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def cache_key(input_path, params):
+    """Key for an input file and a dict of compression parameters.
+    Floats are rounded so 30 and 30.0 land on the same entry."""
+    normalized = {}
+    for name, value in sorted(params.items()):
+        if isinstance(value, float):
+            value = round(value, 4)
+        normalized[name] = value
+    normalized['engine_version'] = ENGINE_VERSION
+    blob = json.dumps([content_hash(input_path), normalized], sort_keys=True)
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU cache of compressed outputs and their result dicts"""
+
+    def __init__(self, cache_dir=None, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size_mb * 1024 * 1024
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.lock_path = os.path.join(self.cache_dir, 'index.lock')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _lock(self, timeout=30.0):
+        """Crude cross-process lock so parallel batch workers don't clobber index.json"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return
+            except FileExistsError:
+                try:
+                    # A lock left behind by a killed process
+                    if time.time() - os.path.getmtime(self.lock_path) > timeout:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Timed out waiting for the cache lock {self.lock_path}")
+                time.sleep(0.05)
+
+    def _unlock(self):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, key, output_path):
+        """Put the cached output for key at output_path (hardlink if possible, copy otherwise)
+        and return its result dict, or None on a miss."""
+        self._lock()
+        try:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            object_path = os.path.join(self.objects_dir, entry['file'])
+            if not os.path.exists(object_path):
+                del index[key]
+                self._save_index(index)
+                return None
+
+            tmp_path = f"{output_path}.cache-tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            try:
+                os.link(object_path, tmp_path)
+            except OSError:
+                shutil.copyfile(object_path, tmp_path)
+            os.replace(tmp_path, output_path)
+
+            entry['last_used'] = time.time()
+            self._save_index(index)
+            return dict(entry['result'])
+        finally:
+            self._unlock()
+
+    def put(self, key, output_path, result):
+        """Store a copy of output_path and its result dict, then evict old entries if needed"""
+        _, ext = os.path.splitext(output_path)
+        file_name = key + ext
+        object_path = os.path.join(self.objects_dir, file_name)
+        tmp_path = object_path + '.tmp'
+        shutil.copyfile(output_path, tmp_path)
+
+        self._lock()
+        try:
+            os.replace(tmp_path, object_path)
+            index = self._load_index()
+            index[key] = {
+                'file': file_name,
+                'size': os.path.getsize(object_path),
+                'last_used': time.time(),
+                'result': result,
+            }
+            self._evict(index)
+            self._save_index(index)
+        finally:
+            self._unlock()
+
+    def _evict(self, index):
+        total = sum(entry['size'] for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.objects_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+            total -= entry['size']
+            del index[key]
+
+    def clear(self):
+        self._lock()
+        try:
+            shutil.rmtree(self.objects_dir, ignore_errors=True)
+            os.makedirs(self.objects_dir, exist_ok=True)
+            self._save_index({})
+        finally:
+            self._unlock()
@@ -0,0 +1,270 @@
+# degradation effects for video shittifier
+#
+# Bitrate is not the only way to make a video worse. The built-in effects are plain ffmpeg filters
+# (and a few x264 settings) that go into the same ffmpeg process as the encode, so a whole stack of
+# them costs about as much as the encode alone:
+#
+#   blocky[=8]        JPEG-style blocks: pixelated 8x8 cells and x264's deblocking switched off
+#   crush[=3]         colour crush, only the top 3 bits of every channel are kept
+#   drop[=8]          drop frames down to 8 fps
+#   deepfry[=1]       oversaturated, overcontrasted, oversharpened and noisy
+#   bitcrush[=4]      audio at 4 bits
+#   samplerate[=8000] audio resampled down to 8 kHz
+#
+# Anything else can be a Python function that takes a batch of RGB frames as a NumPy array of shape
+# (frames, height, width, 3), dtype uint8, and returns one of the same shape. Those run in between a
+# decoding and an encoding ffmpeg, a batch at a time, so the function can work on the whole batch at
+# once instead of frame by frame (which is what makes MoviePy's fl_image so slow).
+
+import subprocess
+import threading
+
+from progress import PROGRESS_ARGS, ProgressParser, drain_stderr
+
+# Frames handed to a custom effect per call
+BATCH_FRAMES = 16
+
+
+def _blocky(size):
+    size = max(2, int(size))
+    return {'video': [f"pixelize=w={size}:h={size}"], 'video_args': ['-x264-params', 'no-deblock=1']}
+
+
+def _crush(bits):
+    bits = min(7, max(1, int(bits)))
+    mask = 256 - 2 ** (8 - bits)
+    channel = f"'bitand(val,{mask})'"
+    return {'video': [f"lutyuv=y={channel}:u={channel}:v={channel}"]}
+
+
+def _drop(fps):
+    return {'fps': fps}
+
+
+def _deepfry(amount):
+    amount = max(0.0, amount)
+    return {'video': [
+        f"eq=saturation={min(3.0, 1 + 2 * amount):.2f}:contrast={1 + 0.8 * amount:.2f}:brightness={0.04 * amount:.2f}",
+        f"unsharp=5:5:{min(5.0, 1.5 * amount):.2f}",
+        f"noise=alls={min(100, int(12 * amount))}:allf=t",
+    ]}
+
+
+def _bitcrush(bits):
+    return {'audio': [f"acrusher=bits={min(16, max(1, int(bits)))}:mix=1"]}
+
+
+def _samplerate(rate):
+    return {'audio': [f"aresample={max(1000, int(rate))}"]}
+
+
+# name: (builder, default strength)
+EFFECTS = {
+    'blocky': (_blocky, 8),
+    'crush': (_crush, 3),
+    'drop': (_drop, 8),
+    'deepfry': (_deepfry, 1),
+    'bitcrush': (_bitcrush, 4),
+    'samplerate': (_samplerate, 8000),
+}
+
+
+def parse_effects(spec):
+    """Normalize an effect list: 'deepfry,crush=2' or a list of names, 'name=strength' strings,
+    (name, strength) tuples and custom frame functions. Returns a list of (name, strength) tuples
+    and callables."""
+    if isinstance(spec, str):
+        spec = [item for item in spec.split(',') if item.strip()]
+    effects = []
+    for item in spec or []:
+        if callable(item):
+            effects.append(item)
+            continue
+        if isinstance(item, str):
+            name, _, value = item.strip().partition('=')
+            item = (name, value or None)
+        name, value = item
+        name = name.strip().lower()
+        if name not in EFFECTS:
+            raise ValueError(f"Unknown effect '{name}'. Choose from: {', '.join(EFFECTS)}")
+        try:
+            strength = float(value) if value is not None else EFFECTS[name][1]
+        except ValueError:
+            raise ValueError(f"invalid strength '{value}' for effect '{name}'")
+        if strength <= 0:
+            raise ValueError(f"the strength of '{name}' must be greater than 0")
+        effects.append((name, strength))
+    return effects
+
+
+def effect_graph(effects):
+    """Turn a parse_effects() list into what the encode needs:
+    {'video': video filters, 'audio': audio filters, 'video_args': extra encoder arguments,
+    'fps': frame rate to drop to, if an effect sets one, 'custom': the custom frame functions, in order}.
+    The frame drop isn't in 'video': it goes before everything else (see fps_filters), so the
+    other filters have fewer frames to work on."""
+    graph = {'video': [], 'audio': [], 'video_args': [], 'fps': None, 'custom': []}
+    for effect in effects:
+        if callable(effect):
+            graph['custom'].append(effect)
+            continue
+        name, strength = effect
+        built = EFFECTS[name][0](strength)
+        graph['video'] += built.get('video', [])
+        graph['audio'] += built.get('audio', [])
+        graph['video_args'] += built.get('video_args', [])
+        if built.get('fps'):
+            graph['fps'] = min(graph['fps'] or built['fps'], built['fps'])
+    return graph
+
+
+def fps_filters(graph):
+    return [f"fps={graph['fps']:g}"] if graph['fps'] else []
+
+
+def effect_names(effects):
+    """Readable names for results and cache keys; custom functions go by their __name__"""
+    return [getattr(e, '__name__', 'custom') if callable(e) else f"{e[0]}={e[1]:g}" for e in effects]
+
+
+def _read_exact(stream, view):
+    """Fill a writable buffer from a pipe; False at the end of the stream"""
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            return False
+        filled += count
+    return True
+
+
+def _read_ppm_header(stream):
+    """ffmpeg's PPM frames start with 'P6\\n<width> <height>\\n255\\n'. Returns (width, height) or None at the end."""
+    magic = stream.readline()
+    if not magic:
+        return None
+    if magic.strip() != b'P6':
+        raise IOError(f"Unexpected frame header from the decoder: {magic[:20]!r}")
+    width, height = (int(v) for v in stream.readline().split())
+    stream.readline()  # maxval, always 255 for rgb24
+    return width, height
+
+
+def encode_frame_effects(engine, input_path, output_path, functions, video_bitrate, audio_bitrate, has_audio, fps,
+                         threads=2, preset='medium', on_progress=None, duration=None, batch_frames=BATCH_FRAMES):
+    """Encode input_path with custom NumPy frame effects applied.
+    One ffmpeg decodes (applying engine.video_filters) to RGB frames, this process runs every function
+    over them batch_frames at a time, and a second ffmpeg encodes the result with the audio from
+    input_path (applying engine.audio_filters). fps is the frame rate the frames come out at.
+    Returns the number of frames encoded."""
+    import numpy as np
+
+    decode_cmd = [
+        *engine.base_command(),
+        *engine.input_args,
+        '-i', input_path,
+        '-map', '0:v:0',
+    ]
+    if engine.video_filters:
+        decode_cmd += ['-vf', ','.join(engine.video_filters)]
+    # Constant frame rate, so the encoder can time the frames without any timestamps
+    decode_cmd += ['-r', f"{fps:g}", '-f', 'image2pipe', '-c:v', 'ppm', 'pipe:1']
+
+    decoder = subprocess.Popen(decode_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    encoder = None
+    processes = [decoder]
+    decode_parser = ProgressParser(lambda event: None, duration, 'decode')
+    drains = [threading.Thread(target=drain_stderr, args=(decoder.stderr, decode_parser), daemon=True)]
+    drains[0].start()
+    if getattr(engine, 'monitor', None):
+        engine.monitor.watch(decoder)
+
+    encode_parser = ProgressParser(on_progress or (lambda event: None), duration, 'effects')
+    frames = 0
+    try:
+        size = _read_ppm_header(decoder.stdout)
+        if size is None:
+            decoder.wait()
+            drains[0].join()
+            raise IOError(f"The decoder produced no frames: {' | '.join(decode_parser.other_lines[-3:])}")
+        width, height = size
+
+        encode_cmd = [
+            *engine.base_command(),
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}", '-r', f"{fps:g}", '-i', 'pipe:0',
+            '-i', input_path,
+            '-map', '0:v:0',
+            '-c:v', 'libx264',
+            '-b:v', video_bitrate,
+            '-preset', preset,
+            '-threads', str(threads),
+            '-pix_fmt', 'yuv420p',
+            *engine.video_args,
+        ]
+        if has_audio:
+            encode_cmd += ['-map', '1:a:0', '-c:a', 'aac', '-b:a', audio_bitrate]
+            if engine.audio_filters:
+                encode_cmd += ['-af', ','.join(engine.audio_filters)]
+        else:
+            encode_cmd += ['-an']
+        encode_cmd += [output_path]
+        if on_progress:
+            encode_cmd = encode_cmd[:1] + PROGRESS_ARGS + encode_cmd[1:]
+        encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        processes.append(encoder)
+        drains.append(threading.Thread(target=drain_stderr, args=(encoder.stderr, encode_parser), daemon=True))
+        drains[1].start()
+        if getattr(engine, 'monitor', None):
+            engine.monitor.watch(encoder)
+
+        batch = np.empty((batch_frames, height, width, 3), dtype=np.uint8)
+        frame_bytes = height * width * 3
+        buffer = memoryview(batch.reshape(-1))
+        while size is not None:
+            count = 0
+            # The first header is already read when a batch starts
+            while size is not None and count < batch_frames:
+                if size != (width, height):
+                    raise IOError(f"The frame size changed mid-stream ({width}x{height} -> {size[0]}x{size[1]})")
+                if not _read_exact(decoder.stdout, buffer[count * frame_bytes:(count + 1) * frame_bytes]):
+                    size = None
+                    break
+                count += 1
+                size = _read_ppm_header(decoder.stdout)
+            if not count:
+                break
+            result = batch[:count]
+            for function in functions:
+                result = function(result)
+                if getattr(result, 'shape', None) != (count, height, width, 3):
+                    raise ValueError(f"Effect {getattr(function, '__name__', function)} returned shape "
+                                     f"{getattr(result, 'shape', None)}, expected {(count, height, width, 3)}")
+            encoder.stdin.write(np.ascontiguousarray(result, dtype=np.uint8).data)
+            frames += count
+        encoder.stdin.close()
+        decoder.wait()
+        encoder.wait()
+        for drain in drains:
+            drain.join()
+    except BrokenPipeError:
+        # The encoder died, its exit code and stderr tell why
+        encoder.wait()
+        for drain in drains:
+            drain.join()
+    except BaseException:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        raise
+    finally:
+        decoder.stdout.close()
+        if decoder.poll() is None:
+            decoder.kill()
+            decoder.wait()
+
+    # The encoder first: when it dies, the decoder gets killed too
+    if encoder.returncode != 0:
+        raise IOError(f"ffmpeg exited with code {encoder.returncode}: {' | '.join(encode_parser.other_lines[-3:])}")
+    if decoder.returncode != 0:
+        raise IOError(f"ffmpeg (decoder) exited with code {decoder.returncode}: {' | '.join(decode_parser.other_lines[-3:])}")
+    return frames
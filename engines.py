@@ -0,0 +1,268 @@
+# encode backends for video shittifier
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from progress import PROGRESS_ARGS, ProgressParser, moviepy_logger
+
+# Bump this whenever a change makes the engines produce different output for the same settings,
+# so cached results from older versions are not reused
+ENGINE_VERSION = 2
+
+
+def find_ffmpeg():
+    """Locate an ffmpeg binary: $FFMPEG_BINARY, then PATH, then the one bundled with imageio-ffmpeg.
+    Returns None if none can be found."""
+    env_binary = os.environ.get('FFMPEG_BINARY')
+    if env_binary and env_binary != 'ffmpeg-imageio' and shutil.which(env_binary):
+        return shutil.which(env_binary)
+    if shutil.which('ffmpeg'):
+        return shutil.which('ffmpeg')
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+class MoviePyEngine:
+    """Encodes through MoviePy's write_videofile.
+    Every frame is decoded into a NumPy array in Python and piped back into a second ffmpeg process,
+    so it's slower, but it's the original behaviour and works anywhere MoviePy does."""
+
+    name = 'moviepy'
+    direct_ffmpeg = False
+
+    def encode(self, input_path, output_path, video_bitrate, audio_bitrate, has_audio,
+               threads=2, preset='medium', on_progress=None, duration=None, clip=None):
+        import moviepy.editor as mp
+
+        logger = moviepy_logger(on_progress, duration) if on_progress else None
+
+        own_clip = clip is None
+        if own_clip:
+            clip = mp.VideoFileClip(input_path)
+        try:
+            if has_audio:
+                clip.write_videofile(
+                    output_path,
+                    codec='libx264',
+                    audio_codec='aac',
+                    bitrate=video_bitrate,
+                    audio_bitrate=audio_bitrate,
+                    preset=preset,
+                    threads=threads,
+                    logger=logger
+                )
+            else:
+                clip.write_videofile(
+                    output_path,
+                    codec='libx264',
+                    bitrate=video_bitrate,
+                    preset=preset,
+                    threads=threads,
+                    audio=False,
+                    logger=logger
+                )
+        finally:
+            if own_clip:
+                clip.close()
+
+
+class FFmpegEngine:
+    """Encodes with a single ffmpeg process (decode -> libx264/aac -> mux).
+    Frames never pass through Python, which avoids the extra copies and pipe traffic of MoviePy."""
+
+    name = 'ffmpeg'
+    direct_ffmpeg = True
+
+    def __init__(self, binary=None):
+        self.binary = binary or find_ffmpeg()
+        if not self.binary:
+            raise FileNotFoundError("ffmpeg binary not found. Install ffmpeg or imageio-ffmpeg.")
+        # Set by compress_video for bounded-memory encodes (see memory.py)
+        self.input_args = []
+        self.video_args = []
+        # Set by compress_video when the bitrate can't carry the source resolution (see geometry.py)
+        # and for effects (see effects.py)
+        self.video_filters = []
+        self.audio_filters = []
+        self.monitor = None
+        # Set by compress_video when the job is profiled (see metrics.py)
+        self.profiler = None
+
+    def base_command(self):
+        """What every ffmpeg command line here starts with: quiet apart from errors, never prompting"""
+        return [self.binary, '-hide_banner', '-nostdin', '-y', '-loglevel', 'error']
+
+    def build_command(self, input_path, output_path, video_bitrate, audio_bitrate, has_audio,
+                      threads=2, preset='medium', pass_number=None, passlog=None, output_format=None,
+                      audio_optional=False, video_copy=False, audio_copy=False):
+        """Build the ffmpeg command line for a plain bitrate re-encode.
+        pass_number/passlog turn it into one half of a two-pass encode; pass 1 only analyses video.
+        output_format forces a muxer, needed when writing to a pipe. audio_optional maps the audio
+        track only if there is one, for input that couldn't be probed. video_copy/audio_copy pass
+        that stream through untouched instead of re-encoding it."""
+        cmd = [
+            *self.base_command(),
+            *self.input_args,
+            '-i', input_path,
+            '-map', '0:v:0',
+        ]
+        if video_copy:
+            cmd += ['-c:v', 'copy']
+        else:
+            cmd += [
+                '-c:v', 'libx264',
+                '-b:v', video_bitrate,
+                '-preset', preset,
+                '-threads', str(threads),
+                '-pix_fmt', 'yuv420p',
+                *self.video_args,
+            ]
+            if self.video_filters:
+                cmd += ['-vf', ','.join(self.video_filters)]
+        if pass_number:
+            cmd += ['-pass', str(pass_number), '-passlogfile', passlog]
+        if pass_number == 1:
+            return cmd + ['-an', '-f', 'null', '-']
+        if has_audio and audio_copy:
+            cmd += ['-map', '0:a:0', '-c:a', 'copy']
+        elif has_audio:
+            cmd += ['-map', '0:a:0?' if audio_optional else '0:a:0', '-c:a', 'aac', '-b:a', audio_bitrate]
+            if self.audio_filters:
+                cmd += ['-af', ','.join(self.audio_filters)]
+        else:
+            cmd += ['-an']
+        if output_format:
+            cmd += ['-f', output_format]
+        cmd += [output_path]
+        return cmd
+
+    def run(self, cmd, on_progress=None, duration=None, stage='encode'):
+        """Run an ffmpeg command, raising IOError with the tail of stderr if it fails.
+        With on_progress, ffmpeg reports its progress on stderr and every update is passed on as an event."""
+        if on_progress:
+            cmd = cmd[:1] + PROGRESS_ARGS + cmd[1:]
+        parser = ProgressParser(on_progress or (lambda event: None), duration, stage)
+        started = time.perf_counter()
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if self.monitor:
+            self.monitor.watch(process)
+        for line in process.stderr:
+            parser.feed(line)
+        process.wait()
+        if self.profiler:
+            self.profiler.record(f"ffmpeg {stage}", time.perf_counter() - started)
+        if process.returncode != 0:
+            # Keep the last few lines, that's where ffmpeg puts the actual reason
+            raise IOError(f"ffmpeg exited with code {process.returncode}: {' | '.join(parser.other_lines[-3:])}")
+
+    def encode(self, input_path, output_path, video_bitrate, audio_bitrate, has_audio,
+               threads=2, preset='medium', on_progress=None, duration=None, clip=None,
+               video_copy=False, audio_copy=False):
+        self.run(self.build_command(input_path, output_path, video_bitrate, audio_bitrate, has_audio, threads, preset,
+                                    video_copy=video_copy, audio_copy=audio_copy),
+                 on_progress, duration, 'remux' if video_copy and (audio_copy or not has_audio) else 'encode')
+
+    def encode_two_pass(self, input_path, output_path, target_bytes, video_bitrate, audio_bitrate, has_audio,
+                        threads=2, preset='medium', tolerance=5.0, max_corrections=2, on_progress=None, duration=None):
+        """Two-pass libx264 encode aimed at target_bytes.
+        If the result still lands more than `tolerance` percent away from the target, the second pass is
+        repeated (reusing the first-pass stats) with the video bitrate scaled by the miss, at most
+        max_corrections times. The attempt closest to the target ends up at output_path.
+        Returns a list of {'video_bitrate', 'size'} dicts, one per second-pass attempt."""
+        workdir = tempfile.mkdtemp(prefix='shittifier_2pass_')
+        passlog = os.path.join(workdir, 'x264')
+        filename, ext = os.path.splitext(output_path)
+        attempts = []
+        try:
+            self.run(self.build_command(input_path, None, video_bitrate, audio_bitrate, has_audio,
+                                         threads, preset, pass_number=1, passlog=passlog),
+                     on_progress, duration, 'pass 1')
+
+            video_kbps = int(video_bitrate.rstrip('k'))
+            for attempt in range(max_corrections + 1):
+                attempt_path = f"{filename}.pass{attempt}{ext}"
+                self.run(self.build_command(input_path, attempt_path, f"{video_kbps}k", audio_bitrate, has_audio,
+                                             threads, preset, pass_number=2, passlog=passlog),
+                         on_progress, duration, f"pass 2 (try {attempt + 1})" if attempt else 'pass 2')
+                size = os.path.getsize(attempt_path)
+                attempts.append({'video_bitrate': f"{video_kbps}k", 'size': size, 'path': attempt_path})
+
+                error_percent = (size - target_bytes) / target_bytes * 100
+                if abs(error_percent) <= tolerance:
+                    break
+                new_kbps = max(10, int(video_kbps * target_bytes / size))
+                if new_kbps == video_kbps:
+                    # Already at the bitrate floor, another pass won't change anything
+                    break
+                video_kbps = new_kbps
+
+            best = min(attempts, key=lambda a: (a['size'] > target_bytes * (1 + tolerance / 100), abs(a['size'] - target_bytes)))
+            os.replace(best['path'], output_path)
+            return [{'video_bitrate': a['video_bitrate'], 'size': a['size']} for a in attempts]
+        finally:
+            for a in attempts:
+                if os.path.exists(a['path']):
+                    os.remove(a['path'])
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+# Codecs that can be stream-copied into each output container, None meaning anything goes
+COPYABLE_VIDEO = {
+    '.mp4': {'h264', 'hevc', 'mpeg4', 'av1'},
+    '.mov': {'h264', 'hevc', 'mpeg4', 'av1', 'prores', 'mjpeg'},
+    '.mkv': None,
+    '.avi': {'h264', 'mpeg4', 'mjpeg'},
+}
+COPYABLE_AUDIO = {
+    '.mp4': {'aac', 'mp3', 'ac3', 'opus'},
+    '.mov': {'aac', 'mp3', 'ac3', 'alac', 'pcm_s16le'},
+    '.mkv': None,
+    '.avi': {'mp3', 'ac3', 'pcm_s16le'},
+}
+
+
+def _fits(codec, bitrate_bps, budget, copyable):
+    if not codec or not bitrate_bps:
+        return False
+    if copyable is not None and codec not in copyable:
+        return False
+    return bitrate_bps / 1000 <= int(budget.rstrip('k'))
+
+
+def plan_streams(info, video_bitrate, audio_bitrate, output_path):
+    """Decide per stream whether it needs re-encoding: a stream that is already at or under its
+    bitrate budget, in a codec the output container takes, is copied as is.
+    Returns {'video': 'copy' or 'encode', 'audio': 'copy', 'encode' or None}."""
+    ext = os.path.splitext(output_path)[1].lower()
+    video_bps = info.video_bitrate
+    audio_bps = info.audio_bitrate if info.has_audio else 0
+    if not video_bps and info.bit_rate and audio_bps is not None:
+        # Matroska and friends don't store per-stream bitrates, the container total minus the audio is close
+        video_bps = info.bit_rate - audio_bps
+    return {
+        'video': 'copy' if ext in COPYABLE_VIDEO and _fits(info.video_codec, video_bps, video_bitrate, COPYABLE_VIDEO[ext]) else 'encode',
+        'audio': None if not info.has_audio else
+                 'copy' if ext in COPYABLE_AUDIO and _fits(info.audio_codec, audio_bps, audio_bitrate, COPYABLE_AUDIO[ext]) else 'encode',
+    }
+
+
+ENGINES = {
+    'moviepy': MoviePyEngine,
+    'ffmpeg': FFmpegEngine,
+}
+
+
+def get_engine(name='auto'):
+    """Return an engine instance by name. 'auto' uses ffmpeg directly when a binary is available
+    and falls back to MoviePy otherwise."""
+    if name == 'auto':
+        return FFmpegEngine() if find_ffmpeg() else MoviePyEngine()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine '{name}'. Choose from: auto, {', '.join(ENGINES)}")
+    return ENGINES[name]()
@@ -0,0 +1,191 @@
+# size/time prediction and feasibility checks for video shittifier
+#
+# Before committing to a full encode, a few short excerpts spread over the clip are encoded with the
+# real settings. How many bytes x264 actually produced for them (at very low bitrates it can't get
+# down to the requested rate and overshoots) and how long they took is scaled up to the whole clip.
+# Together with the bitrate floors from calculate_bitrates this says up front whether a target is
+# reachable, instead of finding out after a full encode with "Size increased" or a broken pipe.
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from effects import parse_effects, effect_graph, fps_filters
+from engines import find_ffmpeg, FFmpegEngine
+from geometry import plan_geometry, geometry_filters, MIN_BPP
+from probe import probe
+
+# calculate_bitrates never goes below these (kbit/s)
+VIDEO_FLOOR_KBPS = 10
+AUDIO_FLOOR_KBPS = 8
+# Sampled encodes may land this far (percent) over the target before the target counts as unreachable
+DEFAULT_TOLERANCE = 10.0
+# MP4 index and headers on top of the streams
+CONTAINER_OVERHEAD = 1.01
+
+
+def _kbps(bitrate):
+    return int(bitrate.rstrip('k'))
+
+
+def sample_windows(duration, samples=3, sample_seconds=2.0):
+    """(start, length) of the excerpts to encode: evenly spread, away from the very start and end.
+    Short clips are encoded whole."""
+    if duration <= samples * sample_seconds * 2:
+        return [(0.0, duration)]
+    step = duration / (samples + 1)
+    return [(step * (i + 1) - sample_seconds / 2, sample_seconds) for i in range(samples)]
+
+
+def sample_encode(engine, input_path, video_bitrate, audio_bitrate, windows, threads=2, preset='medium',
+                  video_filters=None, audio_filters=None, video_args=None):
+    """Encode every window to raw H.264 and ADTS AAC streams (no container overhead to skew small samples).
+    audio_bitrate None skips the audio; the filters and extra encoder arguments (downscaling, effects) are
+    applied like in the real encode. Returns {'video_bytes', 'audio_bytes', 'seconds', 'wall'}
+    summed over all windows."""
+    workdir = tempfile.mkdtemp(prefix='shittifier_estimate_')
+    totals = {'video_bytes': 0, 'audio_bytes': 0, 'seconds': 0.0, 'wall': 0.0}
+    try:
+        for i, (start, length) in enumerate(windows):
+            video_path = os.path.join(workdir, f"sample_{i}.h264")
+            audio_path = os.path.join(workdir, f"sample_{i}.aac")
+            cmd = [
+                *engine.base_command(),
+                '-ss', f"{start:.3f}", '-t', f"{length:.3f}", '-i', input_path,
+                '-map', '0:v:0', '-c:v', 'libx264', '-b:v', video_bitrate, '-preset', preset,
+                '-threads', str(threads), '-pix_fmt', 'yuv420p',
+                *(['-vf', ','.join(video_filters)] if video_filters else []),
+                *(video_args or []),
+                '-an', '-f', 'h264', video_path
+            ]
+            if audio_bitrate:
+                cmd += ['-map', '0:a:0', '-vn', '-c:a', 'aac', '-b:a', audio_bitrate,
+                        *(['-af', ','.join(audio_filters)] if audio_filters else []),
+                        '-f', 'adts', audio_path]
+            started = time.perf_counter()
+            engine.run(cmd)
+            totals['wall'] += time.perf_counter() - started
+            totals['video_bytes'] += os.path.getsize(video_path)
+            if audio_bitrate:
+                totals['audio_bytes'] += os.path.getsize(audio_path)
+            totals['seconds'] += length
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return totals
+
+
+def estimate(input_path, target_size_mb=None, percentage=None, audio_quality='medium', threads=None,
+             preset='medium', samples=3, sample_seconds=2.0, tolerance=DEFAULT_TOLERANCE, downscale=True, effects=None):
+    """Predict what compress_video will produce for these settings without doing the full encode.
+    Returns a dict with the planned bitrates, which bitrate floors are hit, the predicted output size
+    (MB) and encode time (seconds), the 'geometry' it would encode at, 'feasible', a 'reason' when it isn't, and 'suggested_target_size':
+    the smallest target (MB) that is expected to be met, or None if the video can't be made smaller.
+    effects are sampled with the encode (they change how well the video compresses), except custom
+    frame functions, which would need the whole NumPy pipeline."""
+    from api import calculate_bitrates, audio_ratio_for
+    from scheduler import plan_job
+
+    info = probe(input_path)
+    if not info.duration:
+        raise IOError(f"Could not read the duration of {input_path}. Is it a valid video file?")
+    duration = info.duration
+    original_size = info.size / (1024 * 1024)
+    if percentage is not None:
+        target_size_mb = original_size * (percentage / 100)
+    target_size_mb = max(0.1, target_size_mb)
+
+    video_bitrate, audio_bitrate = calculate_bitrates(target_size_mb, duration, info.has_audio,
+                                                      audio_ratio_for(audio_quality))
+    ratio = audio_ratio_for(audio_quality) if info.has_audio else 0
+    total_kbits = target_size_mb * 8192
+    floors = []
+    if total_kbits * (1 - ratio) / duration < VIDEO_FLOOR_KBPS:
+        floors.append('video')
+    if info.has_audio and total_kbits * ratio / duration < AUDIO_FLOOR_KBPS:
+        floors.append('audio')
+    # Smallest target whose split between video and audio stays above both floors
+    floor_kbps = VIDEO_FLOOR_KBPS / (1 - ratio)
+    if info.has_audio and ratio:
+        floor_kbps = max(floor_kbps, AUDIO_FLOOR_KBPS / ratio)
+    floor_size = floor_kbps * duration / 8192
+
+    audio_bytes = _kbps(audio_bitrate) * 1000 / 8 * duration if info.has_audio else 0
+    video_bytes = _kbps(video_bitrate) * 1000 / 8 * duration
+    graph = effect_graph(parse_effects(effects) if effects else [])
+    geometry = None
+    if info.has_video:
+        # Same order as the real encode: frames the drop effect throws away don't need any bits
+        source = info._replace(fps=min(info.fps, graph['fps'])) if graph['fps'] and info.fps else info
+        geometry = plan_geometry(source, video_bitrate, min_bpp=MIN_BPP if downscale else 0)
+    predicted_seconds = None
+    encode_speed = None
+    sampled = False
+    if info.has_video and find_ffmpeg():
+        if threads is None:
+            threads = plan_job(info)
+        sample = sample_encode(
+            FFmpegEngine(), input_path, video_bitrate, audio_bitrate if info.has_audio else None,
+            sample_windows(duration, samples, sample_seconds), threads, preset,
+            fps_filters(graph) + geometry_filters(geometry) + graph['video'], graph['audio'], graph['video_args'])
+        if sample['seconds']:
+            # The encoders overshoot at very low rates, the samples show by how much
+            video_bytes = sample['video_bytes'] / sample['seconds'] * duration
+            if info.has_audio:
+                audio_bytes = sample['audio_bytes'] / sample['seconds'] * duration
+            encode_speed = sample['seconds'] / sample['wall'] if sample['wall'] else None
+            predicted_seconds = duration / encode_speed if encode_speed else None
+            sampled = True
+    predicted_size = (video_bytes + audio_bytes) * CONTAINER_OVERHEAD / (1024 * 1024)
+
+    reason = None
+    suggested = target_size_mb
+    if predicted_size >= original_size:
+        reason = f"the output would be about {predicted_size:.2f} MB, no smaller than the original {original_size:.2f} MB"
+        suggested = None
+    elif predicted_size > target_size_mb * (1 + tolerance / 100):
+        reason = (f"the encoder can't get this video down to {target_size_mb:.2f} MB, it would come out at about "
+                  f"{predicted_size:.2f} MB ({(predicted_size / target_size_mb - 1) * 100:.0f}% over)")
+        # A stream that overshoots is at the smallest the encoder makes it; give each stream at least
+        # that much of the budget, so the new target is actually met
+        needed = video_bytes / (1 - ratio)
+        if info.has_audio and ratio:
+            needed = max(needed, audio_bytes / ratio)
+        suggested = round(max(needed * CONTAINER_OVERHEAD / (1024 * 1024), floor_size) * 1.02, 2)
+    elif floors:
+        reason = f"the {' and '.join(floors)} bitrate would drop below its floor, the output will come out larger"
+        suggested = round(max(floor_size, target_size_mb), 2)
+
+    return {
+        'input': input_path,
+        'duration': duration,
+        'original_size': original_size,
+        'target_size': target_size_mb,
+        'video_bitrate': video_bitrate,
+        'audio_bitrate': audio_bitrate if info.has_audio else None,
+        'geometry': geometry,
+        'floors_hit': floors,
+        'floor_size': floor_size,
+        'predicted_size': predicted_size,
+        'predicted_seconds': predicted_seconds,
+        'encode_speed': encode_speed,
+        'sampled': sampled,
+        'feasible': reason is None,
+        'reason': reason,
+        'suggested_target_size': suggested,
+    }
+
+
+def estimate_batch(input_paths, workers=1, **settings):
+    """estimate() for many files, workers at a time. Returns {input_path: estimate dict};
+    files that can't be estimated map to {'error': message}."""
+    def one(path):
+        try:
+            return estimate(path, **settings)
+        except Exception as e:
+            return {'input': path, 'error': str(e)}
+
+    # The work happens in ffmpeg processes, threads are enough to run several at once
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(input_paths, pool.map(one, input_paths)))
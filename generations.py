@@ -0,0 +1,116 @@
+# fused multi-generation compression for video shittifier
+#
+# "Compress this output further" used to write the output to disk, decode it again and re-encode it,
+# once per round. Here every round is its own ffmpeg process and they are chained with pipes:
+# generation 1 reads the input file, each following generation reads the previous one's Matroska
+# stream from a pipe, and only the last one writes a file. All generations run at the same time,
+# and only compressed data ever travels between them.
+
+import copy
+import os
+import subprocess
+import threading
+import time
+
+from progress import PROGRESS_ARGS, ProgressParser, drain_stderr
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _relay(source, sink, stats):
+    """Copy the stream between two generations, counting bytes and noting when the source finished"""
+    try:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            stats['size'] += len(chunk)
+            sink.write(chunk)
+    except (BrokenPipeError, OSError):
+        # The next generation died, its exit code tells the real story
+        pass
+    finally:
+        stats['finished'] = time.time()
+        source.close()
+        try:
+            sink.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def encode_generations(engine, input_path, output_path, stages, has_audio, threads=2, preset='medium',
+                       on_progress=None, duration=None, plain_video_args=None):
+    """Encode input_path len(stages) times in a row, in one pipeline.
+    stages is a list of (video_bitrate, audio_bitrate), one per generation.
+    The engine's filters (effects, scaling) only go into generation 1; the later ones are plain bitrate
+    re-encodes of its output, with plain_video_args (default: the engine's) instead of engine.video_args.
+    Progress events are tagged with their generation ('generation 2', ...).
+    Returns one dict per generation with its bitrates, size in bytes and seconds until it finished."""
+    processes = []
+    parsers = []
+    threads_list = []
+    stats = []
+    started = time.time()
+    plain = copy.copy(engine)
+    plain.video_filters = []
+    plain.audio_filters = []
+    if plain_video_args is not None:
+        plain.video_args = plain_video_args
+
+    try:
+        for i, (video_bitrate, audio_bitrate) in enumerate(stages):
+            first = i == 0
+            last = i == len(stages) - 1
+            cmd = (engine if first else plain).build_command(
+                input_path if first else 'pipe:0',
+                output_path if last else 'pipe:1',
+                video_bitrate, audio_bitrate, has_audio, threads, preset,
+                output_format=None if last else 'matroska'
+            )
+            if on_progress:
+                cmd = cmd[:1] + PROGRESS_ARGS + cmd[1:]
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL if first else subprocess.PIPE,
+                stdout=subprocess.DEVNULL if last else subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            processes.append(process)
+            if getattr(engine, 'monitor', None):
+                engine.monitor.watch(process)
+
+            parser = ProgressParser(on_progress or (lambda event: None), duration, f"generation {i + 1}")
+            parsers.append(parser)
+            drain = threading.Thread(target=drain_stderr, args=(process.stderr, parser), daemon=True)
+            drain.start()
+            threads_list.append(drain)
+
+            stats.append({'size': 0, 'finished': None})
+            if not first:
+                relay = threading.Thread(target=_relay, args=(processes[i - 1].stdout, process.stdin, stats[i - 1]), daemon=True)
+                relay.start()
+                threads_list.append(relay)
+
+        for process in processes:
+            process.wait()
+        stats[-1]['finished'] = time.time()
+        for thread in threads_list:
+            thread.join()
+    except BaseException:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        raise
+
+    for i, process in enumerate(processes):
+        if process.returncode != 0:
+            raise IOError(f"ffmpeg (generation {i + 1}) exited with code {process.returncode}: {' | '.join(parsers[i].other_lines[-3:])}")
+
+    stats[-1]['size'] = os.path.getsize(output_path)
+    return [{
+        'generation': i + 1,
+        'video_bitrate': video_bitrate,
+        'audio_bitrate': audio_bitrate if has_audio else None,
+        'size': stats[i]['size'],
+        'seconds': stats[i]['finished'] - started,
+    } for i, (video_bitrate, audio_bitrate) in enumerate(stages)]
@@ -0,0 +1,83 @@
+# resolution and frame-rate planning for video shittifier
+#
+# x264 needs some minimum number of bits per pixel per frame before the picture holds together. Below
+# that, a 1080p60 encode at a few hundred kbit/s spends all its time on pixels that come out as mush,
+# and at the very bottom it's where the broken pipes and size overshoots come from. So when the
+# budget can't carry the source, the frame rate is capped and the resolution stepped down until it
+# can: fewer, smaller frames with the same bits look better and encode a lot faster.
+
+import logging
+
+log = logging.getLogger('shittifier.geometry')
+
+# Bits per pixel per frame below which the source geometry isn't kept
+MIN_BPP = 0.05
+# Frame rates above this are the first thing to go
+MAX_FPS = 30
+# Short side of the picture, largest first; never scaled up, never below the last one
+SHORT_SIDES = [2160, 1440, 1080, 720, 540, 480, 360, 288, 240, 180, 144]
+# Frame rates tried once the picture is as small as it gets
+LOW_FPS = [24, 20, 15, 12, 10]
+
+
+def bits_per_pixel(video_bitrate, width, height, fps):
+    """Bits per pixel per frame for a '350k' style bitrate"""
+    if not width or not height or not fps:
+        return None
+    return int(video_bitrate.rstrip('k')) * 1000 / (width * height * fps)
+
+
+def _scaled(width, height, short_side):
+    """Width and height with the shorter side at short_side, aspect kept, both even (yuv420p needs that)"""
+    scale = short_side / min(width, height)
+    return max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+
+
+def plan_geometry(info, video_bitrate, min_bpp=MIN_BPP):
+    """Pick the output resolution and frame rate for a video bitrate budget.
+    Returns {'width', 'height', 'fps', 'bpp', 'scaled', 'source_width', 'source_height', 'source_fps',
+    'source_bpp'}, or None when the probe didn't give a resolution and frame rate to work from."""
+    width, height, fps = info.width, info.height, info.fps
+    source_bpp = bits_per_pixel(video_bitrate, width, height, fps)
+    if source_bpp is None:
+        return None
+    plan = {'width': width, 'height': height, 'fps': fps}
+
+    if source_bpp < min_bpp:
+        if fps > MAX_FPS:
+            plan['fps'] = MAX_FPS
+        short = min(width, height)
+        for side in SHORT_SIDES:
+            if side >= short:
+                continue
+            if bits_per_pixel(video_bitrate, plan['width'], plan['height'], plan['fps']) >= min_bpp:
+                break
+            plan['width'], plan['height'] = _scaled(width, height, side)
+        for rate in LOW_FPS:
+            if bits_per_pixel(video_bitrate, plan['width'], plan['height'], plan['fps']) >= min_bpp:
+                break
+            if rate < plan['fps']:
+                plan['fps'] = rate
+
+    plan['bpp'] = bits_per_pixel(video_bitrate, plan['width'], plan['height'], plan['fps'])
+    plan['scaled'] = (plan['width'], plan['height'], plan['fps']) != (width, height, fps)
+    plan.update(source_width=width, source_height=height, source_fps=fps, source_bpp=source_bpp)
+    if plan['scaled']:
+        log.info(f"{video_bitrate} is {source_bpp:.3f} bits/pixel at {width}x{height}@{fps:g}, "
+                 f"encoding at {plan['width']}x{plan['height']}@{plan['fps']:g} ({plan['bpp']:.3f} bits/pixel)")
+    return plan
+
+
+def geometry_filters(plan):
+    """ffmpeg video filters that turn the source into the planned geometry"""
+    if not plan or not plan['scaled']:
+        return []
+    filters = []
+    if plan['fps'] != plan['source_fps']:
+        filters.append(f"fps={plan['fps']:g}")
+    if (plan['width'], plan['height']) != (plan['source_width'], plan['source_height']):
+        # Set the short side and let the other follow: phone videos are often stored landscape with a
+        # rotation flag, and ffmpeg rotates them before the filters see them
+        side = min(plan['width'], plan['height'])
+        filters.append(f"scale=w='if(lt(iw,ih),{side},-2)':h='if(lt(iw,ih),-2,{side})'")
+    return filters
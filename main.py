@@ -1,76 +1,28 @@
 ﻿# video shittifier
 
-import tkinter as tk
-from tkinter import filedialog
-import moviepy.editor as mp
 import os
-import time
-import threading
 import sys
 from colorama import init, Fore, Style
 
 init()
 
-spinner_active = False
+# The compression itself lives in api.py. These used to be defined here and can still be imported
+# from here; like everything else that isn't needed just to start up, api is loaded on first use.
+API_NAMES = {'JobPlan', 'compress', 'calculate_bitrates', 'audio_ratio_for', 'partial_path_for', 'AUDIO_BITRATE_RATIOS'}
 
-def spinner_animation():
-    """Display a spinner animation in the console while a process is running"""
-    global spinner_active
-    spinner_chars = ['/', '-', '\\', '|']
-    i = 0
-    while spinner_active:
-        sys.stdout.write(f"\r{Fore.CYAN}Compressing video... {spinner_chars[i]}{Style.RESET_ALL}")
-        sys.stdout.flush()
-        i = (i + 1) % len(spinner_chars)
-        time.sleep(0.2)
-    
-    sys.stdout.write("\r" + " " * 30 + "\r")
-    sys.stdout.flush()
 
-class CustomLogger:
-    """A custom logger for MoviePy that shows a spinner instead of a progress bar"""
-    
-    def __init__(self):
-        self.spinner_thread = None
-        self.last_t = 0
-    
-    def callback(self, t):
-        """Called by MoviePy to update progress.
-        We'll use this to drive our spinner animation."""
-        global spinner_active
-        
-        if t == 0:
-            spinner_active = True
-            self.spinner_thread = threading.Thread(target=spinner_animation)
-            self.spinner_thread.daemon = True
-            self.spinner_thread.start()
-        
-        if t == 1.0 and spinner_active:
-            spinner_active = False
-            if self.spinner_thread:
-                self.spinner_thread.join(timeout=1.0)
-                self.spinner_thread = None
-        
-        self.last_t = t
-        
-    def __call__(self, t):
-        """Required for the logger interface"""
-        self.callback(t)
-        
-    def __enter__(self):
-        """Required for context manager support"""
-        return self
-        
-    def __exit__(self, exc_type, exc_value, traceback):
-        """Stop the spinner when exiting context"""
-        global spinner_active
-        spinner_active = False
-        if self.spinner_thread:
-            self.spinner_thread.join(timeout=1.0)
-            self.spinner_thread = None
+def __getattr__(name):
+    if name in API_NAMES:
+        import api
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def select_video_file():
+    # Only the interactive mode opens a window, headless runs never load tkinter
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()
     file_path = filedialog.askopenfilename(
@@ -83,217 +35,33 @@ def select_video_file():
     return file_path
 
 
-def compress_video(input_path, output_path, target_size_mb=None, percentage=None, audio_quality='medium', retry_count=0):
-    valid_audio_qualities = ['high', 'medium', 'low', 'very-low']
-    # Allow custom audio quality values (they start with 'custom-')
-    if audio_quality not in valid_audio_qualities and not audio_quality.startswith('custom-'):
-        print(f"{Fore.YELLOW}Warning: Invalid audio quality '{audio_quality}'. Defaulting to 'medium'.{Style.RESET_ALL}")
-        audio_quality = 'medium'
-        
-    if target_size_mb is not None and target_size_mb < 0.1:
-        print(f"{Fore.RED}Warning: Target size is very small ({target_size_mb:.2f} MB).{Style.RESET_ALL}")
-        print(f"{Fore.RED}This may cause compression errors. Adjusting to minimum size of 0.1 MB.{Style.RESET_ALL}")
-        target_size_mb = 0.1
-    
-    if percentage is not None:
-        estimated_size = os.path.getsize(input_path) * (percentage / 100) / (1024 * 1024)
-        if estimated_size < 0.1:
-            print(f"{Fore.RED}Warning: Target percentage would result in a very small file ({estimated_size:.2f} MB).{Style.RESET_ALL}")
-            print(f"{Fore.RED}This may cause compression errors. Consider using a higher percentage.{Style.RESET_ALL}")
-    
-    if os.path.exists(output_path):
-        try:
-            with open(output_path, 'a'):
-                pass
-        except PermissionError:
-            if retry_count < 3:
-                print(f"{Fore.YELLOW}Output file is in use or cannot be accessed. Trying with a different filename...{Style.RESET_ALL}")
-                # Generate a new output path with a unique suffix
-                filename, ext = os.path.splitext(output_path)
-                new_output_path = f"{filename}_{retry_count+1}{ext}"
-                return compress_video(input_path, new_output_path, target_size_mb, percentage, audio_quality, retry_count+1)
-            else:
-                raise PermissionError(f"Cannot access the output file after {retry_count} retries. Please close any applications using the file.")
-    
-    try:
+LEVEL_COLORS = {'info': Fore.BLUE, 'warning': Fore.YELLOW, 'error': Fore.RED, 'success': Fore.GREEN, 'result': Fore.CYAN}
 
-        video = mp.VideoFileClip(input_path)
 
-        has_audio = hasattr(video, 'audio') and video.audio is not None
-        
-        if not has_audio:
-            print(f"{Fore.YELLOW}Note: This video does not have an audio track.{Style.RESET_ALL}")
-            print(f"{Fore.YELLOW}Audio compression will be skipped.{Style.RESET_ALL}")
-        
-        original_size = os.path.getsize(input_path) / (1024 * 1024)
-        
-        if percentage is not None:
-            target_size_mb = original_size * (percentage / 100)
-            print(f"{Fore.BLUE}Compressing to {percentage}% of original size ({target_size_mb:.2f} MB){Style.RESET_ALL}")
-        else:
-            # Use provided target size
-            print(f"{Fore.BLUE}Compressing to target size of {target_size_mb} MB{Style.RESET_ALL}")
+def compress_video(input_path, output_path, target_size_mb=None, percentage=None, audio_quality='medium', retry_count=0, threads=None, show_progress=True, engine='auto', rate_control='single', size_tolerance=5.0, segments=None, cache=None, generations=1, progress_callback=None, progress_log=None, preset='medium', memory_limit_mb=None, resume=False, on_infeasible=None, downscale=True, effects=None, profile=False, metrics_path=None):
+    """Console client of api.compress(): prints its messages in colour and draws the progress line"""
+    from api import JobPlan, compress
+    from progress import ConsoleProgress
 
-        duration = video.duration
-        
-        if audio_quality.startswith('custom-'):
-            try:
-                custom_percent = float(audio_quality.split('-')[1])
-                audio_bitrate_ratio = custom_percent / 100
-                audio_codec = 'aac'
-                print(f"{Fore.BLUE}Using custom audio quality: {custom_percent}% of total bitrate{Style.RESET_ALL}")
-            except (ValueError, IndexError):
-                audio_bitrate_ratio = 0.15
-                audio_codec = 'aac'
-                print(f"{Fore.YELLOW}Error parsing custom audio quality. Using medium (15%) instead.{Style.RESET_ALL}")
-        elif audio_quality == 'high':
-            audio_bitrate_ratio = 0.20
-            audio_codec = 'aac'
-            print(f"{Fore.BLUE}Using high audio quality{Style.RESET_ALL}")
-        elif audio_quality == 'medium':
-            audio_bitrate_ratio = 0.15
-            audio_codec = 'aac'
-            print(f"{Fore.BLUE}Using medium audio quality{Style.RESET_ALL}")
-        elif audio_quality == 'low':
-            audio_bitrate_ratio = 0.10
-            audio_codec = 'aac'
-            print(f"{Fore.BLUE}Using low audio quality{Style.RESET_ALL}")
-        elif audio_quality == 'very-low':
-            audio_bitrate_ratio = 0.05
-            audio_codec = 'aac'
-            print(f"{Fore.BLUE}Using very low audio quality{Style.RESET_ALL}")
-        else:
-            audio_bitrate_ratio = 0.15
-            audio_codec = 'aac'
-            print(f"{Fore.BLUE}Using default (medium) audio quality{Style.RESET_ALL}")
-        
-        total_kbits = (target_size_mb * 8192)
-        
-        if not has_audio:
-            audio_kbits = 0
-            video_kbits = total_kbits
-            audio_bitrate = '0k'
-        else:
-            audio_kbits = total_kbits * audio_bitrate_ratio
-            video_kbits = total_kbits - audio_kbits
-            audio_bitrate = str(max(8, int(audio_kbits / duration))) + 'k'  # Minimum 8k audio bitrate
-        
-        video_bitrate = str(max(10, int(video_kbits / duration))) + 'k'  # Minimum 10k video bitrate
-        
-        if has_audio:
-            print(f"{Fore.BLUE}Video bitrate: {video_bitrate}, Audio bitrate: {audio_bitrate}{Style.RESET_ALL}")
-        else:
-            print(f"{Fore.BLUE}Video bitrate: {video_bitrate}, No audio stream{Style.RESET_ALL}")
-
-        try:
-            custom_progress = CustomLogger()
-            
-            global spinner_active
-            spinner_active = True
-            spinner_thread = threading.Thread(target=spinner_animation)
-            spinner_thread.daemon = True
-            spinner_thread.start()
-            
-            try:
-                if has_audio:
-                    video.write_videofile(
-                        output_path,
-                        codec='libx264',
-                        audio_codec=audio_codec,
-                        bitrate=video_bitrate,
-                        audio_bitrate=audio_bitrate,
-                        preset='medium',
-                        threads=2
-                    )
-                else:
-                    video.write_videofile(
-                        output_path,
-                        codec='libx264',
-                        bitrate=video_bitrate,
-                        preset='medium',
-                        threads=2,
-                        audio=False
-                    )
-            finally:
-                spinner_active = False
-                spinner_thread.join(timeout=1.0)
-        except (IOError, OSError) as e:
-            spinner_active = False
-            if 'spinner_thread' in locals() and spinner_thread.is_alive():
-                spinner_thread.join(timeout=1.0)
-                
-            if "Permission denied" in str(e):
-                if retry_count < 3:
-                    print(f"{Fore.YELLOW}Permission error when writing file. Trying with a different filename...{Style.RESET_ALL}")
-                    filename, ext = os.path.splitext(output_path)
-                    new_output_path = f"{filename}_alt{retry_count+1}{ext}"
-                    video.close()
-                    return compress_video(input_path, new_output_path, target_size_mb, percentage, audio_quality, retry_count+1)
-                else:
-                    video.close()
-                    raise PermissionError(f"Cannot write to output file after {retry_count} retries. Please check file permissions.")
-            elif "Broken pipe" in str(e):
-                video.close()
-                if target_size_mb < 0.5 and retry_count < 2:
-                    print(f"{Fore.YELLOW}Broken pipe error. This may be due to extremely low bitrate. Trying with a higher minimum size...{Style.RESET_ALL}")
-                    return compress_video(input_path, output_path, 0.5, None, audio_quality, retry_count+1)
-                else:
-                    print(f"{Fore.RED}Broken pipe error details: {str(e)}{Style.RESET_ALL}")
-                    print(f"{Fore.YELLOW}This error often occurs when the ffmpeg process is terminated unexpectedly.{Style.RESET_ALL}")
-                    print(f"{Fore.YELLOW}This can happen with extremely small target sizes or permission issues.{Style.RESET_ALL}")
-                    raise IOError(f"Broken pipe error during compression. The target size may be too small for this video or there might be a file access issue.")
-            else:
-                video.close()
-                raise e
-
-        video.close()
+    plan = JobPlan(input_path, output_path, target_size_mb, percentage, audio_quality, threads, engine, rate_control,
+                   size_tolerance, segments, cache, generations, preset, memory_limit_mb, resume, on_infeasible,
+                   downscale, effects, progress_log, profile, metrics_path)
+    console = ConsoleProgress() if show_progress else None
 
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            raise IOError(f"Compression failed: Output file {output_path} is missing or empty.")
-
-        final_size = os.path.getsize(output_path) / (1024 * 1024)
-        size_change_percent = ((final_size - original_size) / original_size) * 100
-        compression_ratio = ((original_size - final_size) / original_size) * 100
-        
-        print(f"{Fore.CYAN}Original size: {original_size:.2f} MB{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}Compressed size: {final_size:.2f} MB{Style.RESET_ALL}")
-        
-        if final_size >= original_size:
-            # Size increased
-            print(f"{Fore.RED}[FAIL] Size increased by {abs(size_change_percent):.2f}%{Style.RESET_ALL}")
-            print(f"{Fore.RED}Unable to compress this video further with current settings{Style.RESET_ALL}")
-        elif compression_ratio < 5:
-            # Minimal compression (less than 5%)
-            print(f"{Fore.YELLOW}[WARN] Minimal reduction: {compression_ratio:.2f}%{Style.RESET_ALL}")
-            print(f"{Fore.YELLOW}Video might be already well-compressed or using efficient codec{Style.RESET_ALL}")
-        elif percentage is not None and (abs(percentage - ((final_size / original_size) * 100)) > 10):
-            # Significant deviation from target percentage
-            actual_percentage = (final_size / original_size) * 100
-            print(f"{Fore.YELLOW}Target: {percentage:.2f}% of original size{Style.RESET_ALL}")
-            print(f"{Fore.YELLOW}Actual: {actual_percentage:.2f}% of original size{Style.RESET_ALL}")
-            print(f"{Fore.YELLOW}[WARN] Could not achieve exact target percentage{Style.RESET_ALL}")
-        else:
-            # Successful compression
-            print(f"{Fore.GREEN}[SUCCESS] Reduced by {compression_ratio:.2f}%{Style.RESET_ALL}")
-        
-        return {
-            'original_size': original_size,
-            'final_size': final_size,
-            'compression_ratio': compression_ratio,
-            'size_increased': final_size > original_size,
-            'audio_quality': audio_quality
-        }
+    def on_event(event):
+        if event['type'] == 'progress':
+            if console:
+                console(event)
+            if progress_callback:
+                progress_callback(event)
+            return
+        if console:
+            console.close()
+        print(f"{LEVEL_COLORS[event['level']]}{event['text']}{Style.RESET_ALL}")
 
+    try:
+        return compress(plan, on_event, retry_count)
     except Exception as e:
-        spinner_active = False
-        if 'spinner_thread' in locals() and spinner_thread.is_alive():
-            spinner_thread.join(timeout=1.0)
-            
-        try:
-            video.close()
-        except:
-            pass
-        
         # the error information
         if "Permission denied" in str(e):
             print(f"{Fore.RED}Error: Permission denied when trying to access or write the file.{Style.RESET_ALL}")
@@ -310,6 +78,19 @@ def compress_video(input_path, output_path, target_size_mb=None, percentage=None
             print(f"{Fore.RED}Unexpected error during compression: {str(e)}{Style.RESET_ALL}")
         
         raise
+    finally:
+        if console:
+            console.close()
+
+
+def ask_generations():
+    """Ask how many more rounds of compression to run in one go"""
+    answer = input(f"{Fore.MAGENTA}How many more times? They all run in one go (default 1): {Style.RESET_ALL}").strip()
+    try:
+        return max(1, int(answer)) if answer else 1
+    except ValueError:
+        print(f"{Fore.YELLOW}Invalid number. Compressing once.{Style.RESET_ALL}")
+        return 1
 
 
 def process_compression(input_path):
@@ -447,20 +228,23 @@ def process_compression(input_path):
                 reuse_settings = input(f"{Fore.MAGENTA}Reuse the same compression settings? (y/n): {Style.RESET_ALL}").lower()
                 
                 if reuse_settings == 'y':
+                    generations = ask_generations()
                     try:
                         if compression_params['mode'] == 'P':
                             new_output = process_compression_with_params(
                                 output_path, 
                                 'P', 
                                 percentage=compression_params['percentage'],
-                                audio_quality=compression_params.get('audio_quality', 'medium')
+                                audio_quality=compression_params.get('audio_quality', 'medium'),
+                                generations=generations
                             )
                         else:
                             new_output = process_compression_with_params(
                                 output_path, 
                                 'T', 
                                 target_size=compression_params['target_size'],
-                                audio_quality=compression_params.get('audio_quality', 'medium')
+                                audio_quality=compression_params.get('audio_quality', 'medium'),
+                                generations=generations
                             )
                         return new_output
                     except Exception as e:
@@ -488,7 +272,7 @@ def process_compression(input_path):
         return None
 
 
-def process_compression_with_params(input_path, mode, percentage=None, target_size=None, audio_quality='medium'):
+def process_compression_with_params(input_path, mode, percentage=None, target_size=None, audio_quality='medium', generations=1):
     # Generate output path
     filename, ext = os.path.splitext(input_path)
     # Remove any existing "_compressed" suffix to avoid stacking them
@@ -514,11 +298,11 @@ def process_compression_with_params(input_path, mode, percentage=None, target_si
         if mode == 'P':
             print(f"{Fore.BLUE}Reusing percentage mode: {percentage}%{Style.RESET_ALL}")
             print(f"{Fore.BLUE}Reusing audio quality: {audio_quality}{Style.RESET_ALL}")
-            result = compress_video(input_path, output_path, percentage=percentage, audio_quality=audio_quality)
+            result = compress_video(input_path, output_path, percentage=percentage, audio_quality=audio_quality, generations=generations)
         else:
             print(f"{Fore.BLUE}Reusing target size mode: {target_size} MB{Style.RESET_ALL}")
             print(f"{Fore.BLUE}Reusing audio quality: {audio_quality}{Style.RESET_ALL}")
-            result = compress_video(input_path, output_path, target_size_mb=target_size, audio_quality=audio_quality)
+            result = compress_video(input_path, output_path, target_size_mb=target_size, audio_quality=audio_quality, generations=generations)
         
         if not result['size_increased']:
             print(f"{Fore.GREEN}Compressed video saved to: {output_path}{Style.RESET_ALL}")
@@ -528,10 +312,11 @@ def process_compression_with_params(input_path, mode, percentage=None, target_si
                 reuse_settings = input(f"{Fore.MAGENTA}Reuse the same compression settings? (y/n): {Style.RESET_ALL}").lower()
                 
                 if reuse_settings == 'y':
+                    generations = ask_generations()
                     if mode == 'P':
-                        new_output = process_compression_with_params(output_path, 'P', percentage=percentage, audio_quality=audio_quality)
+                        new_output = process_compression_with_params(output_path, 'P', percentage=percentage, audio_quality=audio_quality, generations=generations)
                     else:
-                        new_output = process_compression_with_params(output_path, 'T', target_size=target_size, audio_quality=audio_quality)
+                        new_output = process_compression_with_params(output_path, 'T', target_size=target_size, audio_quality=audio_quality, generations=generations)
                     return new_output
                 else:
                     return process_compression(output_path)
@@ -588,4 +373,8 @@ def main():
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Any arguments switch to the headless batch mode
+        from batch import run_cli
+        sys.exit(run_cli(sys.argv[1:]))
     main()
@@ -0,0 +1,136 @@
+# memory accounting for video shittifier
+#
+# Frames never pass through Python on the ffmpeg paths, so what an encode holds in memory is decided
+# by ffmpeg: decoder threads, the x264 lookahead and frame threads each keep whole frames around, and
+# at 4K that adds up fast. With a memory ceiling those are sized to fit, and MemoryMonitor samples
+# the resident memory of this process plus every ffmpeg it started, remembers the peak (reported as
+# peak_rss_mb in the result dict) and kills the encode if it goes over the ceiling anyway.
+#
+# RSS is read from /proc on Linux. Elsewhere only the peak is known, from getrusage, after the fact.
+
+import logging
+import os
+import threading
+
+log = logging.getLogger('shittifier.memory')
+
+# ffmpeg + libx264 + aac before any frames are allocated
+BASE_MB = 48
+# x264 keeps the frame itself plus its half-resolution lookahead copy, motion vectors and stats
+FRAME_COPIES = 4
+MAX_LOOKAHEAD = 40
+
+
+def _status_kb(path, field):
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def process_rss_mb(pid='self'):
+    """Resident memory of a process in MB, None where /proc isn't available or the process is gone"""
+    kb = _status_kb(f"/proc/{pid}/status", 'VmRSS')
+    return kb / 1024 if kb is not None else None
+
+
+def available_memory_mb():
+    """Memory that can be used without swapping (MemAvailable), None if unknown"""
+    kb = _status_kb('/proc/meminfo', 'MemAvailable')
+    return kb / 1024 if kb is not None else None
+
+
+def bounded_encoder_args(width, height, memory_limit_mb, threads):
+    """Size the frame buffers of one ffmpeg/libx264 process to fit memory_limit_mb.
+    Returns (threads, input_args, video_args); threads may come back lower than asked for."""
+    frame_mb = (width or 1920) * (height or 1080) * 1.5 / (1024 * 1024)
+    frames = max(0, int((memory_limit_mb - BASE_MB) / (frame_mb * FRAME_COPIES)))
+    # Every encoder thread and every decoder thread holds a frame or two, keep at least 10 frames of
+    # lookahead if that still leaves a thread
+    fitted = max(1, min(threads, (frames - 18) // 3))
+    lookahead = max(0, min(MAX_LOOKAHEAD, frames - 3 * fitted - 8))
+    if frames < 12:
+        log.warning(f"{memory_limit_mb} MB is very little for {width}x{height}, the ceiling may not hold")
+    log.info(f"{memory_limit_mb} MB ceiling, {width}x{height}: {fitted} threads (asked for {threads}), "
+             f"lookahead {lookahead} frames")
+    input_args = ['-threads', str(fitted)]
+    video_args = ['-rc-lookahead', str(lookahead), '-max_muxing_queue_size', '64']
+    return fitted, input_args, video_args
+
+
+class MemoryMonitor:
+    """Samples the RSS of this process plus the ffmpeg processes handed to watch().
+    With limit_mb, everything being watched is killed once the total goes over it and
+    self.exceeded is set."""
+
+    def __init__(self, limit_mb=None, interval=0.2):
+        self.limit_mb = limit_mb
+        self.interval = interval
+        self.processes = []
+        self.peak = 0.0
+        self.exceeded = False
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def watch(self, process):
+        with self.lock:
+            self.processes.append(process)
+        if self.exceeded:
+            process.kill()
+
+    def sample(self):
+        with self.lock:
+            self.processes = [p for p in self.processes if p.poll() is None]
+            processes = list(self.processes)
+        own = process_rss_mb()
+        if own is None:
+            return None
+        total = own + sum(process_rss_mb(p.pid) or 0 for p in processes)
+        self.peak = max(self.peak, total)
+        if self.limit_mb and total > self.limit_mb and not self.exceeded:
+            self.exceeded = True
+            log.warning(f"Memory use {total:.0f} MB is over the {self.limit_mb} MB ceiling, stopping the encode")
+            for process in processes:
+                process.kill()
+        return total
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            if self.sample() is None:
+                return
+
+    def start(self):
+        self.sample()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+        self.sample()
+
+    @property
+    def peak_mb(self):
+        if self.peak:
+            return self.peak
+        try:
+            import resource
+        except ImportError:
+            return None
+        # kB on Linux, bytes on macOS; only the largest single process is known this way
+        scale = 1024 * 1024 if os.uname().sysname == 'Darwin' else 1024
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,130 @@
+# per-job profiling for video shittifier
+#
+# With profile=True (or a metrics path) compress() times every stage of the job and counts the
+# retries and fallbacks it went through, and the result dict gets a 'profile':
+#
+#   {'status': 'ok', 'wall_seconds': 12.4, 'cpu_seconds': 0.61, 'child_cpu_seconds': 23.9, 'peak_rss_mb': 212.0,
+#    'stages': {'probe': {'seconds': 0.08, 'calls': 1}, 'encode': {...}, 'ffmpeg encode': {...}, ...},
+#    'counters': {'permission_retries': 1, 'engine_fallbacks': 1, ...}}
+#
+# The plain stage names (setup, probe, plan, cache lookup, estimate, encode, finalize, cache store,
+# retry, failed) follow each other and add up to the wall time; a retry books the time of the attempt
+# it threw away.
+# 'ffmpeg <stage>' ones time the ffmpeg runs inside them (split, audio, mux, pass 1, ...) and add up
+# when they run side by side. cpu_seconds is this process, child_cpu_seconds the ffmpeg and ffprobe
+# processes it started (where the OS reports it, not on Windows).
+#
+# write_metrics() appends profiles to a JSON lines file, or writes them in the Prometheus text
+# format when the path ends in .prom (for node_exporter's textfile collector).
+
+import json
+import os
+import threading
+import time
+
+from memory import process_rss_mb
+
+
+def _children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class StageProfiler:
+    """Collects the profile of one job. Disabled, every method does nothing, so the calls can stay in place."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.peak_mb = None
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.cpu_started = time.process_time()
+        self.children_started = _children_cpu()
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+
+    def checkpoint(self, name):
+        """Book the time since the previous checkpoint under stage `name`"""
+        now = time.perf_counter()
+        self.record(name, now - self.last)
+        self.last = now
+
+    def count(self, name, amount=1):
+        if not self.enabled or not amount:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def note_peak(self, mb):
+        if self.enabled and mb:
+            self.peak_mb = max(self.peak_mb or 0, mb)
+
+    def summary(self, status='ok'):
+        """The profile dict described at the top"""
+        self.note_peak(process_rss_mb())
+        return {
+            'status': status,
+            'wall_seconds': time.perf_counter() - self.started,
+            'cpu_seconds': time.process_time() - self.cpu_started,
+            'child_cpu_seconds': _children_cpu() - self.children_started,
+            'peak_rss_mb': self.peak_mb,
+            'stages': {name: dict(stage) for name, stage in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+def is_prometheus(path):
+    return path.lower().endswith('.prom')
+
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def prometheus_text(jobs):
+    """Prometheus text format for a list of (labels, profile) pairs, one set of samples per job"""
+    families = [
+        ('shittifier_job_succeeded', "1 if the job produced an output", lambda p: [({}, int(p['status'] != 'error'))]),
+        ('shittifier_job_wall_seconds', "Wall time of the job", lambda p: [({}, p['wall_seconds'])]),
+        ('shittifier_job_cpu_seconds', "CPU time of the job by process",
+         lambda p: [({'process': 'python'}, p['cpu_seconds']), ({'process': 'children'}, p['child_cpu_seconds'])]),
+        ('shittifier_job_peak_rss_bytes', "Peak resident memory of the job and its encoders",
+         lambda p: [({}, p['peak_rss_mb'] * 1024 * 1024)] if p['peak_rss_mb'] else []),
+        ('shittifier_stage_seconds', "Wall time spent in a stage",
+         lambda p: [({'stage': name}, stage['seconds']) for name, stage in p['stages'].items()]),
+        ('shittifier_stage_calls', "Times a stage ran",
+         lambda p: [({'stage': name}, stage['calls']) for name, stage in p['stages'].items()]),
+        ('shittifier_job_events', "Retries and fallbacks during the job",
+         lambda p: [({'event': name}, count) for name, count in p['counters'].items()]),
+    ]
+    lines = []
+    for name, help_text, samples in families:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for labels, profile in jobs:
+            for extra, value in samples(profile):
+                lines.append(f"{name}{_labels(dict(labels, **extra))} {round(value, 6)}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, jobs):
+    """Write a list of (labels, profile) pairs to path. A .prom file is replaced as a whole (the textfile
+    collector must never see half of one); anything else gets one JSON line per job appended."""
+    if is_prometheus(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(prometheus_text(jobs))
+        os.replace(tmp_path, path)
+        return
+    text = ''.join(json.dumps(dict(labels, time=time.time(), **profile)) + "\n" for labels, profile in jobs)
+    with open(path, 'a') as f:
+        f.write(text)
@@ -0,0 +1,195 @@
+# lightweight media probing for video shittifier
+#
+# One ffprobe call per file instead of spinning up a VideoFileClip (which starts a decoder and an
+# audio reader just to tell us the duration). Results are cached per (path, size, mtime).
+
+import json
+import os
+import shutil
+import subprocess
+from collections import namedtuple
+from functools import lru_cache
+
+from engines import find_ffmpeg
+
+MediaInfo = namedtuple('MediaInfo', [
+    'path',
+    'size',            # bytes
+    'duration',        # seconds
+    'bit_rate',        # overall bits/s, None if unknown
+    'format_name',
+    'streams',         # tuple of (index, codec_type, codec_name)
+    'has_video',
+    'has_audio',
+    'width',
+    'height',
+    'fps',
+    'video_codec',
+    'video_bitrate',   # bits/s, None if the container doesn't say
+    'audio_codec',
+    'audio_bitrate',   # bits/s, None if the container doesn't say
+    'keyframes',       # tuple of keyframe timestamps, None unless asked for
+])
+
+
+def find_ffprobe():
+    """Locate ffprobe: next to the ffmpeg binary first, then PATH. Returns None if there isn't one
+    (imageio-ffmpeg only ships ffmpeg)."""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        directory = os.path.dirname(ffmpeg)
+        for name in ('ffprobe', 'ffprobe.exe'):
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return candidate
+    return shutil.which('ffprobe')
+
+
+def _run_ffprobe(cmd, head=None):
+    process = subprocess.run(cmd, input=head, stdin=None if head is not None else subprocess.DEVNULL,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        error = process.stderr.decode(errors='replace').strip().splitlines()
+        raise IOError(f"ffprobe exited with code {process.returncode}: {' | '.join(error[-3:])}")
+    return process.stdout
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rate(rate):
+    """'30000/1001' -> 29.97"""
+    try:
+        num, _, den = str(rate).partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _probe_ffprobe(ffprobe, path, size, head=None):
+    output = _run_ffprobe([
+        ffprobe, '-v', 'error', '-of', 'json',
+        '-show_entries',
+        'format=duration,bit_rate,format_name:'
+        'stream=index,codec_type,codec_name,width,height,avg_frame_rate,r_frame_rate,bit_rate,duration',
+        'pipe:0' if head is not None else path
+    ], head)
+    data = json.loads(output)
+    fmt = data.get('format', {})
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    duration = float(fmt.get('duration') or (video or {}).get('duration') or 0)
+    fps = None
+    if video:
+        fps = _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate'))
+
+    return MediaInfo(
+        path=path,
+        size=size,
+        duration=duration,
+        bit_rate=_int_or_none(fmt.get('bit_rate')),
+        format_name=fmt.get('format_name'),
+        streams=tuple((s.get('index'), s.get('codec_type'), s.get('codec_name')) for s in streams),
+        has_video=video is not None,
+        has_audio=audio is not None,
+        width=_int_or_none((video or {}).get('width')),
+        height=_int_or_none((video or {}).get('height')),
+        fps=fps,
+        video_codec=(video or {}).get('codec_name'),
+        video_bitrate=_int_or_none((video or {}).get('bit_rate')),
+        audio_codec=(audio or {}).get('codec_name'),
+        audio_bitrate=_int_or_none((audio or {}).get('bit_rate')),
+        keyframes=None,
+    )
+
+
+def _probe_moviepy(path, size):
+    """Fallback when there is no ffprobe: MoviePy's parser only runs `ffmpeg -i` and reads the banner,
+    it doesn't decode anything either."""
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(path)
+    width, height = infos.get('video_size') or (None, None)
+    has_video = bool(infos.get('video_found'))
+    has_audio = bool(infos.get('audio_found'))
+    streams = []
+    if has_video:
+        streams.append((len(streams), 'video', None))
+    if has_audio:
+        streams.append((len(streams), 'audio', None))
+    video_bitrate = infos.get('video_bitrate')
+    audio_bitrate = infos.get('audio_bitrate')
+    return MediaInfo(
+        path=path,
+        size=size,
+        duration=float(infos.get('duration') or 0),
+        bit_rate=None,
+        format_name=None,
+        streams=tuple(streams),
+        has_video=has_video,
+        has_audio=has_audio,
+        width=width,
+        height=height,
+        fps=infos.get('video_fps'),
+        video_codec=None,
+        video_bitrate=video_bitrate * 1000 if video_bitrate else None,
+        audio_codec=None,
+        audio_bitrate=audio_bitrate * 1000 if audio_bitrate else None,
+        keyframes=None,
+    )
+
+
+def probe_keyframes(path):
+    """Timestamps of the video keyframes. Reads packet headers only, no decoding."""
+    ffprobe = find_ffprobe()
+    if not ffprobe:
+        raise FileNotFoundError("ffprobe is needed for the keyframe index but was not found.")
+    output = _run_ffprobe([
+        ffprobe, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path
+    ])
+    keyframes = []
+    for line in output.decode(errors='replace').splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return tuple(sorted(keyframes))
+
+
+@lru_cache(maxsize=4096)
+def _probe_cached(path, size, mtime_ns, keyframes):
+    ffprobe = find_ffprobe()
+    if ffprobe:
+        info = _probe_ffprobe(ffprobe, path, size)
+    else:
+        info = _probe_moviepy(path, size)
+    if keyframes:
+        info = info._replace(keyframes=probe_keyframes(path))
+    return info
+
+
+def probe_bytes(head, size=None):
+    """Probe the first bytes of a stream (for input that arrives on a pipe and can't be seeked).
+    Works when the container header carries what we need, e.g. MP4 with the moov atom up front;
+    duration is 0 when the header doesn't say. Returns None without ffprobe or if it can't tell."""
+    ffprobe = find_ffprobe()
+    if not ffprobe:
+        return None
+    try:
+        return _probe_ffprobe(ffprobe, 'pipe:0', size, head)
+    except IOError:
+        return None
+
+
+def probe(path, keyframes=False):
+    """Return a MediaInfo record for path.
+    The result is cached until the file's size or modification time changes."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _probe_cached(path, stat.st_size, stat.st_mtime_ns, keyframes)
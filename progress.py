@@ -0,0 +1,218 @@
+# encoder progress telemetry for video shittifier
+#
+# ffmpeg is started with `-progress pipe:2`, which makes it write key=value blocks to stderr about
+# twice a second. ProgressParser turns those blocks into event dicts:
+#
+#   {'time': unix time, 'stage': 'encode', 'frame': 450, 'fps': 143.2, 'speed': 4.8,
+#    'out_time': 15.0, 'total_size': 812345, 'bitrate_kbps': 433.2, 'percent': 25.0,
+#    'eta': 9.4, 'elapsed': 3.1, 'done': False}
+#
+# Anything can subscribe with a plain callback. ConsoleProgress draws a status line,
+# JsonLinesWriter appends every event to a file for job runners to watch.
+
+import json
+import sys
+import threading
+import time
+
+PROGRESS_ARGS = ['-progress', 'pipe:2', '-nostats']
+
+PROGRESS_KEYS = {
+    'frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time',
+    'dup_frames', 'drop_frames', 'speed', 'progress',
+}
+
+
+def _number(value, suffix=''):
+    try:
+        return float(value[:-len(suffix)] if suffix and value.endswith(suffix) else value)
+    except (TypeError, ValueError):
+        return None
+
+
+def make_event(stage, duration, started, frame=None, fps=None, speed=None, out_time=None,
+               total_size=None, bitrate_kbps=None, done=False):
+    """Build a progress event dict; percent and eta are derived from out_time and the input duration"""
+    percent = None
+    eta = None
+    if duration and out_time is not None:
+        percent = max(0.0, min(100.0, out_time / duration * 100))
+        if speed:
+            eta = max(0.0, (duration - out_time) / speed)
+    if done:
+        percent, eta = 100.0, 0.0
+    return {
+        'time': time.time(),
+        'stage': stage,
+        'frame': frame,
+        'fps': fps,
+        'speed': speed,
+        'out_time': out_time,
+        'total_size': total_size,
+        'bitrate_kbps': bitrate_kbps,
+        'percent': percent,
+        'eta': eta,
+        'elapsed': time.time() - started,
+        'done': done,
+    }
+
+
+class ProgressParser:
+    """Feeds on ffmpeg stderr lines. Progress lines become events, everything else is kept
+    in self.other_lines so error messages aren't lost."""
+
+    def __init__(self, callback, duration=None, stage='encode'):
+        self.callback = callback
+        self.duration = duration
+        self.stage = stage
+        self.started = time.time()
+        self.fields = {}
+        self.other_lines = []
+
+    def feed(self, line):
+        if isinstance(line, bytes):
+            line = line.decode(errors='replace')
+        line = line.strip()
+        key, sep, value = line.partition('=')
+        if not sep or key not in PROGRESS_KEYS:
+            if line:
+                self.other_lines.append(line)
+            return
+        if key != 'progress':
+            self.fields[key] = value
+            return
+
+        f = self.fields
+        out_time_us = _number(f.get('out_time_us'))
+        self.callback(make_event(
+            self.stage,
+            self.duration,
+            self.started,
+            frame=int(_number(f.get('frame')) or 0),
+            fps=_number(f.get('fps')),
+            speed=_number(f.get('speed'), 'x'),
+            out_time=out_time_us / 1000000 if out_time_us is not None and out_time_us >= 0 else None,
+            total_size=int(_number(f.get('total_size')) or 0),
+            bitrate_kbps=_number(f.get('bitrate'), 'kbits/s'),
+            done=value == 'end'
+        ))
+        self.fields = {}
+
+
+def broadcast(*callbacks):
+    """Combine several callbacks (None entries are skipped) into one, or None if there are none"""
+    callbacks = [c for c in callbacks if c]
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def send(event):
+        for callback in callbacks:
+            callback(event)
+    return send
+
+
+def moviepy_logger(callback, duration=None, stage='encode', interval=0.5):
+    """A proglog logger that turns MoviePy's frame/chunk bars into progress events.
+    proglog comes with MoviePy, so it is only imported when the MoviePy engine is used.
+    MoviePy updates its bars on every frame, so events are thinned out to about one per interval."""
+    from proglog import ProgressBarLogger
+
+    class EventLogger(ProgressBarLogger):
+        def __init__(self):
+            super().__init__()
+            self.started = time.time()
+            self.last_sent = 0
+
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if attr != 'index':
+                return
+            total = self.bars[bar].get('total') or 0
+            finished = bool(total) and value >= total
+            if not finished and time.time() - self.last_sent < interval:
+                return
+            self.last_sent = time.time()
+            elapsed = time.time() - self.started
+            # MoviePy writes the audio track ('chunk' bar) before the video frames ('t' bar)
+            if bar == 't':
+                fps_in = total / duration if duration else None
+                out_time = value / fps_in if fps_in else None
+                callback(make_event(
+                    stage, duration, self.started,
+                    frame=value,
+                    fps=value / elapsed if elapsed > 0 else None,
+                    speed=out_time / elapsed if out_time and elapsed > 0 else None,
+                    out_time=out_time,
+                    done=finished
+                ))
+            else:
+                callback(make_event(f"{stage} audio", None, self.started))
+
+    return EventLogger()
+
+
+def drain_stderr(stream, parser):
+    """Keep feeding a ProgressParser from a process's stderr until it closes, so the process never
+    blocks on a full pipe. Meant to run in its own thread."""
+    for line in iter(stream.readline, b''):
+        parser.feed(line)
+    stream.close()
+
+
+class ConsoleProgress:
+    """Draws a one-line status from progress events, replacing the old spinner"""
+
+    def __init__(self, stream=None):
+        # Only the console needs colorama; everything else in here stays free of it (see api.py)
+        from colorama import Fore, Style
+
+        self.colors = (Fore.CYAN, Style.RESET_ALL)
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+        self.width = 0
+
+    def __call__(self, event):
+        parts = [event['stage']]
+        if event['percent'] is not None:
+            parts.append(f"{event['percent']:5.1f}%")
+        if event['frame']:
+            parts.append(f"frame {event['frame']}")
+        if event['fps']:
+            parts.append(f"{event['fps']:.0f} fps")
+        if event['speed']:
+            parts.append(f"{event['speed']:.2f}x")
+        if event['total_size']:
+            parts.append(f"{event['total_size'] / (1024 * 1024):.2f} MB")
+        if event['bitrate_kbps']:
+            parts.append(f"{event['bitrate_kbps']:.0f} kbit/s")
+        if event['eta'] is not None and not event['done']:
+            parts.append(f"ETA {event['eta']:.0f}s")
+        line = " | ".join(parts)
+        with self.lock:
+            self.stream.write(f"\r{self.colors[0]}{line}{self.colors[1]}" + " " * max(0, self.width - len(line)))
+            self.width = len(line)
+            self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            if self.width:
+                self.stream.write("\r" + " " * self.width + "\r")
+                self.stream.flush()
+                self.width = 0
+
+
+class JsonLinesWriter:
+    """Appends every event as one JSON line. Extra fields (like the input file) are added to each event.
+    Lines are written in one call each, so several processes can share a file."""
+
+    def __init__(self, path, **extra):
+        self.path = path
+        self.extra = extra
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(dict(event, **self.extra)) + "\n"
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
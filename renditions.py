@@ -0,0 +1,177 @@
+# rendition ladders for video shittifier
+#
+# The same clip at several targets (say 8 MB, 25 MB and 50% of the original) used to mean one
+# compress_video call, and one full decode, per target. Here a single ffmpeg process decodes the
+# source once and fans the frames out with split/asplit to one encoder per rendition, all running at
+# the same time, each writing its own output file.
+
+import os
+import re
+import time
+
+from engines import get_engine
+from geometry import plan_geometry, geometry_filters, MIN_BPP
+from probe import probe
+from progress import JsonLinesWriter, broadcast
+
+
+def parse_rendition(text):
+    """'8' or '8MB' -> 8 MB target, '50%' -> 50 percent, optionally followed by :<audio quality>
+    (h/m/l/v or a custom percentage), e.g. '25:l' or '50%:v'."""
+    from api import parse_audio_quality
+
+    size, _, audio = text.partition(':')
+    match = re.fullmatch(r'\s*([0-9.]+)\s*(%|mb|m)?\s*', size.lower())
+    if not match:
+        raise ValueError(f"invalid rendition '{text}' (use e.g. 8, 25MB, 50% or 8:l)")
+    value = float(match.group(1))
+    rendition = {'percentage': value} if match.group(2) == '%' else {'target_size_mb': value}
+    if audio:
+        rendition['audio_quality'] = parse_audio_quality(audio)
+    return rendition
+
+
+def rendition_label(rendition):
+    if rendition.get('percentage') is not None:
+        return f"{rendition['percentage']:g}pct"
+    return f"{rendition['target_size_mb']:g}MB"
+
+
+def rendition_output_path(output_path, rendition):
+    """<name>_compressed_<label><ext>, next to the output of a normal compress_video run"""
+    filename, ext = os.path.splitext(output_path)
+    return f"{filename}_{rendition_label(rendition)}{ext}"
+
+
+def check_renditions(renditions, output_path=''):
+    """ValueError if two renditions would be written to the same file, e.g. '8:l' and '8:h'"""
+    paths = set()
+    for rendition in renditions:
+        path = rendition.get('output_path') or rendition_output_path(output_path, rendition)
+        if path in paths:
+            raise ValueError(f"more than one rendition is labelled {rendition_label(rendition)}, "
+                             f"they would overwrite each other's output")
+        paths.add(path)
+
+
+def build_ladder_command(engine, input_path, outputs, has_audio, threads, preset):
+    """One ffmpeg command that decodes input_path once and encodes it once per entry of outputs,
+    a list of (output_path, video_bitrate, audio_bitrate, video_filters)."""
+    count = len(outputs)
+    # Renditions that are scaled down get their own filter chain after the split
+    graph = f"[0:v:0]split={count}" + ''.join(f"[s{i}]" if outputs[i][3] else f"[v{i}]" for i in range(count))
+    for i, (_, _, _, video_filters) in enumerate(outputs):
+        if video_filters:
+            graph += f";[s{i}]{','.join(video_filters)}[v{i}]"
+    if has_audio:
+        graph += f";[0:a:0]asplit={count}" + ''.join(f"[a{i}]" for i in range(count))
+    cmd = [
+        *engine.base_command(),
+        *engine.input_args,
+        '-i', input_path,
+        '-filter_complex', graph,
+    ]
+    for i, (output_path, video_bitrate, audio_bitrate, _) in enumerate(outputs):
+        cmd += [
+            '-map', f"[v{i}]",
+            '-c:v', 'libx264',
+            '-b:v', video_bitrate,
+            '-preset', preset,
+            '-threads', str(threads),
+            '-pix_fmt', 'yuv420p',
+            *engine.video_args,
+        ]
+        if has_audio:
+            cmd += ['-map', f"[a{i}]", '-c:a', 'aac', '-b:a', audio_bitrate]
+        cmd += [output_path]
+    return cmd
+
+
+def compress_renditions(input_path, output_path, renditions, audio_quality='medium', threads=None, preset='medium',
+                        on_event=None, progress_log=None, downscale=True):
+    """Encode input_path once per rendition in a single decode pass.
+    renditions is a list of dicts with 'target_size_mb' or 'percentage', and optionally 'audio_quality'
+    (defaults to audio_quality) and 'output_path' (defaults to output_path with the rendition's label).
+    Every rendition gets its own resolution and frame rate for its budget (see geometry.py) unless downscale is off.
+    Messages and progress go to on_event, as with api.compress().
+    Returns one result dict per rendition, in order, with the same keys as compress_video's plus 'output_path'."""
+    from api import calculate_bitrates, audio_ratio_for, partial_path_for
+    from scheduler import plan_job
+
+    def emit(level, text):
+        if on_event:
+            on_event({'type': 'message', 'time': time.time(), 'level': level, 'text': text})
+
+    if not renditions:
+        raise ValueError("No renditions given.")
+    check_renditions(renditions, output_path)
+    encoder = get_engine('ffmpeg')
+    info = probe(input_path)
+    if not info.duration:
+        raise IOError(f"Could not read the duration of {input_path}. Is it a valid video file?")
+    original_size = info.size / (1024 * 1024)
+
+    plans = []
+    for rendition in renditions:
+        if rendition.get('percentage') is not None:
+            target_size_mb = original_size * (rendition['percentage'] / 100)
+        else:
+            target_size_mb = rendition['target_size_mb']
+        target_size_mb = max(0.1, target_size_mb)
+        quality = rendition.get('audio_quality') or audio_quality
+        video_bitrate, audio_bitrate = calculate_bitrates(target_size_mb, info.duration, info.has_audio,
+                                                          audio_ratio_for(quality))
+        geometry = plan_geometry(info, video_bitrate, min_bpp=MIN_BPP if downscale else 0)
+        path = rendition.get('output_path') or rendition_output_path(output_path, rendition)
+        plans.append({'path': path, 'partial': partial_path_for(path), 'target_size_mb': target_size_mb,
+                      'audio_quality': quality, 'video_bitrate': video_bitrate, 'audio_bitrate': audio_bitrate,
+                      'geometry': geometry})
+        scaled = f", at {geometry['width']}x{geometry['height']} {geometry['fps']:g}fps" if geometry and geometry['scaled'] else ''
+        emit('info', f"{os.path.basename(path)}: {target_size_mb:.2f} MB target, video {video_bitrate}"
+                     f"{f', audio {audio_bitrate}' if info.has_audio else ''}{scaled}")
+
+    if threads is None:
+        # The encoders run side by side and share what one encode would get
+        threads = max(1, plan_job(info) // len(plans))
+    emit('info', f"Encoding {len(plans)} renditions from one decode, {threads} thread(s) each")
+
+    on_progress = broadcast(
+        (lambda event: on_event(dict(event, type='progress'))) if on_event else None,
+        JsonLinesWriter(progress_log, input=input_path, output=output_path) if progress_log else None
+    )
+    cmd = build_ladder_command(encoder, input_path,
+                               [(p['partial'], p['video_bitrate'], p['audio_bitrate'], geometry_filters(p['geometry']))
+                                for p in plans],
+                               info.has_audio, threads, preset)
+    try:
+        encoder.run(cmd, on_progress, info.duration, 'renditions')
+    except BaseException:
+        for p in plans:
+            if os.path.exists(p['partial']):
+                os.remove(p['partial'])
+        raise
+
+    results = []
+    for p in plans:
+        os.replace(p['partial'], p['path'])
+        final_size = os.path.getsize(p['path']) / (1024 * 1024)
+        result = {
+            'original_size': original_size,
+            'final_size': final_size,
+            'compression_ratio': (original_size - final_size) / original_size * 100,
+            'size_increased': final_size > original_size,
+            'audio_quality': p['audio_quality'],
+            'target_size': p['target_size_mb'],
+            'size_error_percent': (final_size - p['target_size_mb']) / p['target_size_mb'] * 100,
+            'rate_control': 'single',
+            'passes': None,
+            'segments': None,
+            'generations': None,
+            'cached': False,
+            'geometry': p['geometry'],
+            'output_path': p['path'],
+        }
+        emit('result', f"{os.path.basename(p['path'])}: {final_size:.2f} MB "
+                       f"({result['size_error_percent']:+.2f}% off the {p['target_size_mb']:.2f} MB target)")
+        results.append(result)
+    return results
@@ -0,0 +1,127 @@
+# core-aware job scheduling for video shittifier
+#
+# Picks how many encodes to run at once and how many threads each one gets, from the CPUs we are
+# allowed to use, the current load and the resolution/length of every clip. libx264 stops scaling
+# well once it has more threads than it can fill with rows of macroblocks, so small clips get few
+# threads and we run more of them side by side instead.
+#
+# With a per-job memory ceiling the number of concurrent jobs is also capped by the available memory.
+#
+# Every decision is logged on the 'shittifier.scheduler' logger so it can be checked against
+# benchmark numbers.
+
+import logging
+import os
+
+from memory import available_memory_mb
+
+log = logging.getLogger('shittifier.scheduler')
+
+X264_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow']
+
+# speed/quality knob -> x264 preset
+SPEED_PRESETS = {
+    'fastest': 'ultrafast',
+    'faster': 'veryfast',
+    'fast': 'faster',
+    'balanced': 'medium',
+    'quality': 'slow',
+    'best': 'veryslow',
+}
+
+MAX_THREADS_PER_JOB = 16
+
+
+def preset_for(speed):
+    """Map a speed name (or a raw x264 preset name) to an x264 preset"""
+    if speed in SPEED_PRESETS:
+        return SPEED_PRESETS[speed]
+    if speed in X264_PRESETS:
+        return speed
+    raise ValueError(f"Unknown speed '{speed}'. Choose from: {', '.join(dict.fromkeys(list(SPEED_PRESETS) + X264_PRESETS))}")
+
+
+def available_cpus():
+    """CPUs this process may run on (respects taskset/cgroup affinity where the OS exposes it)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def system_load():
+    """1-minute load average, or 0 where the OS doesn't have one (Windows)"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def free_cpus(cpus=None, load=None):
+    cpus = available_cpus() if cpus is None else cpus
+    load = system_load() if load is None else load
+    free = max(1, int(round(cpus - load)))
+    log.info(f"{cpus} CPUs available, load {load:.2f} -> {free} free")
+    return free
+
+
+def useful_threads(info):
+    """How many encoder threads a clip can keep busy, going by its height.
+    Roughly 240p: 3, 720p: 8, 1080p: 12, capped at MAX_THREADS_PER_JOB."""
+    height = (info.height if info is not None else None) or 720
+    return max(1, min(MAX_THREADS_PER_JOB, int(round(height / 90))))
+
+
+def plan_job(info, cpus=None, load=None):
+    """Thread count for a single encode that has the machine to itself"""
+    free = free_cpus(cpus, load)
+    threads = min(useful_threads(info), free)
+    log.info(f"{_describe(info)}: {threads} threads (useful up to {useful_threads(info)}, {free} free CPUs)")
+    return threads
+
+
+def plan_batch(infos, jobs=None, threads=None, cpus=None, load=None, memory_limit_mb=None, memory_mb=None):
+    """Plan a batch of encodes. jobs/threads fix those numbers instead of choosing them.
+    Returns {'workers': concurrent jobs, 'threads': [threads per clip], 'free_cpus': n}.
+
+    Without fixed numbers the free CPUs are shared out so that the total thread count roughly matches
+    them: the number of concurrent jobs is free CPUs divided by the typical useful thread count of
+    the clips, and each job gets at most its fair share of the free CPUs."""
+    free = free_cpus(cpus, load)
+    count = max(1, len(infos))
+
+    if jobs is None:
+        wanted = sorted(useful_threads(info) for info in infos) or [1]
+        typical = wanted[len(wanted) // 2]
+        per_job = threads or min(typical, free)
+        jobs = max(1, min(count, free // max(1, per_job)))
+        log.info(f"{count} clips, typical useful threads {typical} -> {jobs} concurrent jobs")
+    else:
+        jobs = max(1, min(count, jobs))
+        log.info(f"{count} clips, concurrent jobs fixed at {jobs}")
+
+    if memory_limit_mb:
+        # Every job stays under its ceiling, so that many of them fit in the available memory
+        memory_mb = available_memory_mb() if memory_mb is None else memory_mb
+        if memory_mb:
+            fit = max(1, int(memory_mb // memory_limit_mb))
+            if fit < jobs:
+                log.info(f"{memory_mb:.0f} MB available, {memory_limit_mb} MB per job -> {fit} concurrent jobs")
+                jobs = fit
+
+    share = max(1, free // jobs)
+    plan = []
+    for info in infos:
+        job_threads = threads or min(useful_threads(info), share)
+        plan.append(job_threads)
+        log.info(f"{_describe(info)}: {job_threads} threads")
+    return {'workers': jobs, 'threads': plan, 'free_cpus': free}
+
+
+def _describe(info):
+    if info is None:
+        return "unknown clip"
+    name = os.path.basename(info.path)
+    if info.width and info.height:
+        return f"{name} ({info.width}x{info.height}, {info.duration:.0f}s)"
+    return f"{name} ({info.duration:.0f}s)"
@@ -0,0 +1,240 @@
+# segment-parallel encoding for video shittifier
+#
+# The video stream is cut at keyframes (stream copy, no decoding), every chunk is encoded by its own
+# ffmpeg process at the same time, and the encoded chunks are joined again with the concat demuxer
+# (stream copy again). Audio is encoded once, next to the chunks, and muxed in at the end, so there
+# are no clicks or gaps at the chunk borders.
+#
+# With a journal directory the work is resumable: chunks and the audio track are kept there as they
+# finish, and journal.json records which ones are done. Running the same encode again (same input and
+# settings) only encodes what is missing. A journal that doesn't match is thrown away.
+
+import csv
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from progress import make_event
+
+
+def split_at_keyframes(engine, input_path, workdir, segment_count, duration):
+    """Cut the first video stream into roughly segment_count chunks without re-encoding.
+    Cuts can only happen on keyframes, so the actual count and lengths may differ.
+    Returns a list of (path, start, end) tuples in playback order."""
+    segment_time = max(1.0, duration / segment_count)
+    segment_list = os.path.join(workdir, 'segments.csv')
+    engine.run([
+        *engine.base_command(),
+        '-i', input_path,
+        '-map', '0:v:0', '-c', 'copy',
+        '-f', 'segment',
+        '-segment_time', f"{segment_time:.3f}",
+        '-segment_format', 'matroska',
+        '-segment_list', segment_list,
+        '-segment_list_type', 'csv',
+        '-reset_timestamps', '1',
+        os.path.join(workdir, 'source_%04d.mkv')
+    ], stage='split')
+
+    chunks = []
+    with open(segment_list, newline='') as f:
+        for row in csv.reader(f):
+            if row:
+                chunks.append((os.path.join(workdir, row[0]), float(row[1]), float(row[2])))
+    return chunks
+
+
+def encode_audio(engine, input_path, output_path, audio_bitrate):
+    engine.run([
+        *engine.base_command(),
+        '-i', input_path,
+        '-map', '0:a:0', '-vn', '-c:a', 'aac', '-b:a', audio_bitrate,
+        *(['-af', ','.join(engine.audio_filters)] if engine.audio_filters else []),
+        output_path
+    ], stage='audio')
+
+
+def concat_segments(engine, segment_paths, audio_path, output_path):
+    """Join the encoded chunks (and the audio track, if any) with stream copy"""
+    list_path = os.path.join(os.path.dirname(segment_paths[0]), 'concat.txt')
+    with open(list_path, 'w') as f:
+        for path in segment_paths:
+            # concat demuxer syntax: single quotes, with ' written as '\''
+            escaped = os.path.abspath(path).replace('\\', '/').replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [
+        *engine.base_command(),
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+    ]
+    if audio_path:
+        cmd += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0']
+    cmd += ['-c', 'copy', output_path]
+    engine.run(cmd, stage='mux')
+
+
+JOURNAL_VERSION = 2
+# Resumable encodes are cut into chunks of about this many seconds, so a crash costs at most that much work
+CHECKPOINT_SECONDS = 60
+
+
+def checkpoint_count(duration, workers=1):
+    """Number of chunks for a resumable encode: one per CHECKPOINT_SECONDS, at least one per worker"""
+    return max(workers or 1, int(math.ceil(duration / CHECKPOINT_SECONDS)))
+
+
+def resume_dir_for(output_path):
+    """Where the journal and finished chunks of output_path are kept, next to the output"""
+    directory, name = os.path.split(os.path.abspath(output_path))
+    return os.path.join(directory, f".{name}.resume")
+
+
+def _load_journal(workdir, identity):
+    """The journal in workdir if it belongs to the same encode, otherwise start over with an empty one"""
+    try:
+        with open(os.path.join(workdir, 'journal.json'), 'r') as f:
+            journal = json.load(f)
+        if journal.get('identity') == identity:
+            return journal
+    except (FileNotFoundError, ValueError):
+        pass
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    return {'identity': identity, 'chunks': None, 'done': [], 'audio_done': False}
+
+
+def _save_journal(workdir, journal):
+    tmp_path = os.path.join(workdir, 'journal.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(journal, f, indent=1)
+    os.replace(tmp_path, os.path.join(workdir, 'journal.json'))
+
+
+def _encode_to(path, encode):
+    """Run encode(temp path) and only then move the result to path, so a file under its final name is complete"""
+    base, ext = os.path.splitext(path)
+    tmp_path = f"{base}.part{ext}"
+    encode(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def encode_segmented(engine, input_path, output_path, video_bitrate, audio_bitrate, has_audio, duration,
+                     segment_count, threads=2, preset='medium', on_progress=None, workers=None, journal_dir=None):
+    """Encode input_path in segment_count keyframe-aligned chunks, workers of them (default: all) at a time.
+    Every chunk is encoded at the same video bitrate, which gives each one a share of the bit budget
+    proportional to its length, so the total size matches a normal single encode.
+    on_progress gets one combined event for all chunks whenever any of them reports progress.
+    With journal_dir, finished chunks are kept there and reused by a later run of the same encode;
+    the directory is removed once the output is complete.
+    Returns {'count': number of chunks, 'reused': chunks taken from an earlier run}."""
+    started = time.time()
+    chunk_events = {}
+    lock = threading.Lock()
+    workers = workers or segment_count
+
+    def chunk_progress(index):
+        def update(event):
+            with lock:
+                chunk_events[index] = event
+                events = list(chunk_events.values())
+            # Chunks run side by side, so their frames, speeds and sizes simply add up
+            on_progress(make_event(
+                'segments', duration, started,
+                frame=sum(e['frame'] or 0 for e in events),
+                fps=sum(e['fps'] or 0 for e in events),
+                speed=sum(e['speed'] or 0 for e in events),
+                out_time=sum(e['out_time'] or 0 for e in events),
+                total_size=sum(e['total_size'] or 0 for e in events)
+            ))
+        return update if on_progress else None
+
+    if journal_dir:
+        workdir = journal_dir
+        stat = os.stat(input_path)
+        journal = _load_journal(workdir, {
+            'version': JOURNAL_VERSION,
+            'input': os.path.abspath(input_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'video_bitrate': video_bitrate,
+            'audio_bitrate': audio_bitrate if has_audio else None,
+            'preset': preset,
+            'segment_count': segment_count,
+            # Effects, the downscaled geometry and the memory-bounded encoder settings all live in
+            # these, and chunks encoded with different ones must not end up in the same output
+            'input_args': list(engine.input_args),
+            'video_args': list(engine.video_args),
+            'video_filters': list(engine.video_filters),
+            'audio_filters': list(engine.audio_filters),
+        })
+    else:
+        workdir = tempfile.mkdtemp(prefix='.shittifier_segments_', dir=os.path.dirname(os.path.abspath(output_path)))
+        journal = None
+    completed = False
+    try:
+        if journal and journal['chunks'] and all(os.path.exists(os.path.join(workdir, c[0])) for c in journal['chunks']):
+            chunks = [(os.path.join(workdir, name), start, end) for name, start, end in journal['chunks']]
+        else:
+            chunks = split_at_keyframes(engine, input_path, workdir, segment_count, duration)
+            if journal:
+                journal.update(chunks=[(os.path.basename(p), start, end) for p, start, end in chunks], done=[])
+                _save_journal(workdir, journal)
+        if not chunks:
+            raise IOError("Splitting the video into segments produced no output.")
+
+        def encoded_path_for(index):
+            return os.path.splitext(chunks[index][0])[0].replace('source_', 'encoded_') + '.mp4'
+
+        reused = set()
+        if journal:
+            reused = {i for i in journal['done'] if i < len(chunks) and os.path.exists(encoded_path_for(i))}
+            for i in reused:
+                # Count finished chunks as done in the combined progress
+                chunk_events[i] = make_event('segments', None, started, out_time=chunks[i][2] - chunks[i][1])
+
+        def encode_chunk(index):
+            source_path, start, end = chunks[index]
+            encoded_path = encoded_path_for(index)
+            if index in reused:
+                return encoded_path
+            _encode_to(encoded_path, lambda path: engine.run(
+                engine.build_command(source_path, path, video_bitrate, None, False, threads, preset),
+                chunk_progress(index), end - start))
+            if journal:
+                with lock:
+                    journal['done'] = sorted(set(journal['done']) | {index})
+                    _save_journal(workdir, journal)
+            return encoded_path
+
+        def encode_audio_track():
+            if journal and journal['audio_done'] and os.path.exists(audio_path):
+                return
+            _encode_to(audio_path, lambda path: encode_audio(engine, input_path, path, audio_bitrate))
+            if journal:
+                with lock:
+                    journal['audio_done'] = True
+                    _save_journal(workdir, journal)
+
+        audio_path = os.path.join(workdir, 'audio.m4a') if has_audio else None
+        # Every task here just waits on an ffmpeg process, so threads are enough to keep them all busy
+        with ThreadPoolExecutor(max_workers=1) as audio_pool, \
+                ThreadPoolExecutor(max_workers=min(len(chunks), workers)) as pool:
+            audio_future = audio_pool.submit(encode_audio_track) if has_audio else None
+            encoded_paths = list(pool.map(encode_chunk, range(len(chunks))))
+            if audio_future:
+                audio_future.result()
+
+        concat_segments(engine, encoded_paths, audio_path, output_path)
+        if on_progress:
+            on_progress(make_event('segments', duration, started, total_size=os.path.getsize(output_path), done=True))
+        completed = True
+        return {'count': len(chunks), 'reused': len(reused)}
+    finally:
+        # A journal directory survives failures, that's the point of it
+        if completed or not journal:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,472 @@
+# local job queue service for video shittifier
+#
+# A long-running process that other tools can hand clips to, without paying the import/startup
+# cost every time. Jobs go into a SQLite database, a pool of warm worker processes (imports already
+# done) picks them up, and a small JSON-over-HTTP API on localhost or a Unix socket lets clients
+# submit, poll and cancel them. Standard library only.
+#
+#   python service.py serve --workers 4                       (http://127.0.0.1:8765)
+#   python service.py serve --socket /tmp/shittifier.sock
+#   python service.py submit clip.mp4 -p 30                   -> job id
+#   python service.py status 12
+#   python service.py cancel 12
+#
+# API:
+#   POST   /jobs        {"input_path": ..., "output_path": optional, "percentage" or "target_size_mb", ...}
+#   GET    /jobs        list of jobs (?status=queued|running|done|failed|cancelled)
+#   GET    /jobs/<id>   one job, with the compress_video result dict once it is done
+#   DELETE /jobs/<id>   cancel a queued or running job
+#   POST   /estimate    same body as /jobs, answers with the predicted size/time without queueing anything
+#
+# POST bodies must be sent as application/json: a web page can send text/plain to localhost without
+# asking, but not JSON. Outputs, progress logs and metrics can only be written inside the --root
+# directories (default: the home and temp directories).
+
+import argparse
+import http.client
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_PORT = 8765
+DEFAULT_DB = os.path.join(os.path.expanduser('~'), '.cache', 'video-shittifier', 'jobs.db')
+DEFAULT_ROOTS = [os.path.expanduser('~'), tempfile.gettempdir()]
+
+# compress_video arguments a client may set
+JOB_OPTIONS = {
+    'percentage', 'target_size_mb', 'audio_quality', 'threads', 'preset', 'engine', 'rate_control',
+    'size_tolerance', 'segments', 'generations', 'progress_log', 'memory_limit_mb',
+    'resume', 'on_infeasible', 'downscale', 'effects', 'profile', 'metrics_path',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker_pid INTEGER,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class JobStore:
+    """The persistent job queue. Every process opens its own connection."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params)
+
+    def submit(self, input_path, output_path, options):
+        cursor = self._execute(
+            "INSERT INTO jobs (status, input_path, output_path, options, created) VALUES ('queued', ?, ?, ?, ?)",
+            (input_path, output_path, json.dumps(options), time.time())
+        )
+        return cursor.lastrowid
+
+    def claim(self, worker_pid):
+        """Atomically take the oldest queued job, or return None"""
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    self.db.execute('COMMIT')
+                    return None
+                self.db.execute(
+                    "UPDATE jobs SET status = 'running', worker_pid = ?, started = ? WHERE id = ?",
+                    (worker_pid, time.time(), row['id'])
+                )
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        return self.get(row['id'])
+
+    def finish(self, job_id, result=None, error=None):
+        status = 'done' if error is None else 'failed'
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ? AND status = 'running'",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+
+    def cancel(self, job_id):
+        """Cancel a queued job right away, or flag a running one for the supervisor to kill.
+        Returns the job's status afterwards, or None if there is no such job."""
+        self._execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                      (time.time(), job_id))
+        self._execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        job = self.get(job_id)
+        return job['status'] if job else None
+
+    def mark_cancelled(self, job_id):
+        self._execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'running'",
+                      (time.time(), job_id))
+
+    def requeue_orphans(self):
+        """Jobs left 'running' by a previous service that died go back to the queue"""
+        self._execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, started = NULL WHERE status = 'running'")
+
+    def running(self):
+        return [dict(row) for row in self._execute("SELECT id, worker_pid, cancel_requested FROM jobs WHERE status = 'running'")]
+
+    def get(self, job_id):
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def list(self, status=None, limit=200):
+        if status:
+            rows = self._execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit))
+        else:
+            rows = self._execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [_job_dict(row) for row in rows]
+
+
+def _job_dict(row):
+    job = dict(row)
+    job['options'] = json.loads(job['options'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    job['timings'] = {
+        'queued_seconds': (job['started'] or job['finished'] or time.time()) - job['created'],
+        'run_seconds': (job['finished'] or time.time()) - job['started'] if job['started'] else None,
+    }
+    return job
+
+
+def worker_main(db_path, poll_interval):
+    """A warm worker: imports everything once, then keeps taking jobs from the queue"""
+    if hasattr(os, 'setsid'):
+        # Own process group, so cancelling a job can take the ffmpeg children down with it
+        os.setsid()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def terminate(signum, frame):
+        # Unwinds through compress(), which removes the partial output
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    # The expensive imports happen here, once
+    importlib.import_module('api')
+    from batch import run_job
+
+    store = JobStore(db_path)
+    while True:
+        job = store.claim(os.getpid())
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        outcome = run_job(job['input_path'], job['output_path'], **job['options'])
+        result = outcome['result']
+        if result is not None:
+            result = dict(result, elapsed=outcome['elapsed'], output_path=outcome['output'])
+        store.finish(job['id'], result=result, error=outcome['error'])
+
+
+class Service:
+    """Keeps the worker pool alive and handles cancellations"""
+
+    def __init__(self, db_path, workers, poll_interval=0.5):
+        self.db_path = db_path
+        self.worker_count = workers
+        self.poll_interval = poll_interval
+        self.store = JobStore(db_path)
+        self.workers = []
+        self.stopping = threading.Event()
+        self.context = multiprocessing.get_context('spawn' if sys.platform == 'win32' else 'fork')
+
+    def _spawn(self):
+        process = self.context.Process(target=worker_main, args=(self.db_path, self.poll_interval), daemon=True)
+        process.start()
+        return process
+
+    def _signal(self, process, signum):
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(process.pid, signum)
+            elif signum == signal.SIGTERM:
+                process.terminate()
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _kill(self, process, grace=5.0):
+        """SIGTERM first so the job can remove its partial output, SIGKILL if it takes longer than grace"""
+        self._signal(process, signal.SIGTERM)
+        process.join(timeout=grace)
+        if process.is_alive():
+            self._signal(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            process.join(timeout=5)
+
+    def start(self):
+        self.store.requeue_orphans()
+        self.workers = [self._spawn() for _ in range(self.worker_count)]
+        threading.Thread(target=self._supervise, daemon=True).start()
+
+    def _supervise(self):
+        while not self.stopping.wait(self.poll_interval):
+            by_pid = {p.pid: p for p in self.workers}
+            for job in self.store.running():
+                process = by_pid.get(job['worker_pid'])
+                if job['cancel_requested'] and process is not None:
+                    # Cancelled first, so the job failing while it's stopped doesn't count as a failure
+                    self.store.mark_cancelled(job['id'])
+                    self._kill(process)
+                elif process is None or not process.is_alive():
+                    self.store.finish(job['id'], error="Worker process died during the job")
+            # Replace workers that were killed or crashed
+            for i, process in enumerate(self.workers):
+                if not process.is_alive():
+                    process.join(timeout=0)
+                    self.workers[i] = self._spawn()
+
+    def stop(self):
+        self.stopping.set()
+        for process in self.workers:
+            self._kill(process)
+
+
+def inside_roots(path, roots):
+    """True if path (symlinks resolved) is in one of the root directories"""
+    path = os.path.realpath(path)
+    for root in roots:
+        root = os.path.realpath(root)
+        if os.path.commonpath([path, root]) == root:
+            return True
+    return False
+
+
+def make_handler(store, roots=DEFAULT_ROOTS):
+    from batch import output_path_for
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def address_string(self):
+            # client_address is an empty string on Unix sockets
+            return self.client_address[0] if self.client_address else 'unix'
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _job_id(self, path):
+            parts = path.strip('/').split('/')
+            if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+                return int(parts[1])
+            return None
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip('/') == '/jobs':
+                status = parse_qs(url.query).get('status', [None])[0]
+                return self._send(200, store.list(status))
+            job_id = self._job_id(url.path)
+            job = store.get(job_id) if job_id is not None else None
+            if job is None:
+                return self._send(404, {'error': 'no such job'})
+            self._send(200, job)
+
+        def do_POST(self):
+            path = urlparse(self.path).path.rstrip('/')
+            if path not in ('/jobs', '/estimate'):
+                return self._send(404, {'error': 'not found'})
+            if self.headers.get_content_type() != 'application/json':
+                return self._send(415, {'error': 'the body must be sent as application/json'})
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._send(400, {'error': 'body must be JSON'})
+
+            input_path = body.get('input_path')
+            if not input_path or not os.path.isfile(input_path):
+                return self._send(400, {'error': 'input_path must be an existing file'})
+            if (body.get('percentage') is None) == (body.get('target_size_mb') is None):
+                return self._send(400, {'error': 'give exactly one of percentage or target_size_mb'})
+            unknown = set(body) - JOB_OPTIONS - {'input_path', 'output_path'}
+            if unknown:
+                return self._send(400, {'error': f"unknown fields: {', '.join(sorted(unknown))}"})
+
+            input_path = os.path.abspath(input_path)
+            if path == '/estimate':
+                from estimate import estimate
+                settings = {k: body[k] for k in ('target_size_mb', 'percentage', 'audio_quality', 'threads', 'preset',
+                                                 'downscale', 'effects')
+                            if body.get(k) is not None}
+                try:
+                    return self._send(200, estimate(input_path, **settings))
+                except Exception as e:
+                    return self._send(400, {'error': str(e)})
+            output_path = os.path.abspath(body.get('output_path') or output_path_for(input_path))
+            for field, target in (('output_path', output_path), ('progress_log', body.get('progress_log')),
+                                  ('metrics_path', body.get('metrics_path'))):
+                if target and not inside_roots(target, roots):
+                    return self._send(403, {'error': f"{field} must be inside {', '.join(roots)}"})
+            options = {k: v for k, v in body.items() if k in JOB_OPTIONS}
+            job_id = store.submit(input_path, output_path, options)
+            self._send(201, store.get(job_id))
+
+        def do_DELETE(self):
+            job_id = self._job_id(urlparse(self.path).path)
+            status = store.cancel(job_id) if job_id is not None else None
+            if status is None:
+                return self._send(404, {'error': 'no such job'})
+            self._send(200, {'id': job_id, 'status': status, 'cancel_requested': status == 'running'})
+
+    return Handler
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def serve(db_path, workers, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None, roots=None):
+    service = Service(db_path, workers)
+    service.start()
+    handler = make_handler(service.store, roots or DEFAULT_ROOTS)
+    if socket_path:
+        server = UnixHTTPServer(socket_path, handler)
+        where = f"unix:{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        where = f"http://{host}:{port}"
+    print(f"Video shittifier service on {where} with {workers} worker(s), jobs in {db_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def request(method, path, body=None, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None):
+    """Tiny client for the service API. Returns (status, decoded JSON)."""
+    connection = UnixHTTPConnection(socket_path) if socket_path else http.client.HTTPConnection(host, port)
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {'Content-Type': 'application/json'} if data else {}
+    connection.request(method, path, body=data, headers=headers)
+    response = connection.getresponse()
+    payload = json.loads(response.read() or b'null')
+    connection.close()
+    return response.status, payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Video shittifier job queue service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', help="use a Unix socket instead of TCP")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help="run the service")
+    serve_parser.add_argument('--db', default=DEFAULT_DB, help=f"job database (default: {DEFAULT_DB})")
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help="worker processes (default: free CPUs / 2)")
+    serve_parser.add_argument('--root', action='append',
+                              help="directory jobs may write outputs, progress logs and metrics to, can be given "
+                                   "more than once (default: the home and temp directories)")
+
+    submit = sub.add_parser('submit', help="queue a file")
+    submit.add_argument('input')
+    mode = submit.add_mutually_exclusive_group(required=True)
+    mode.add_argument('-p', '--percentage', type=float)
+    mode.add_argument('-t', '--target-size', type=float)
+    submit.add_argument('-a', '--audio-quality', default='medium')
+    submit.add_argument('-o', '--output')
+
+    status = sub.add_parser('status', help="show a job, or all jobs")
+    status.add_argument('id', nargs='?', type=int)
+
+    cancel = sub.add_parser('cancel', help="cancel a job")
+    cancel.add_argument('id', type=int)
+
+    args = parser.parse_args()
+    connect = {'host': args.host, 'port': args.port, 'socket_path': args.socket}
+
+    if args.command == 'serve':
+        workers = args.workers
+        if workers is None:
+            from scheduler import free_cpus
+            workers = max(1, free_cpus() // 2)
+        serve(args.db, workers, args.host, args.port, args.socket, args.root)
+        return 0
+
+    if args.command == 'submit':
+        from batch import parse_audio_quality
+        body = {
+            'input_path': os.path.abspath(args.input),
+            'percentage': args.percentage,
+            'target_size_mb': args.target_size,
+            'audio_quality': parse_audio_quality(args.audio_quality),
+        }
+        body = {k: v for k, v in body.items() if v is not None}
+        if args.output:
+            body['output_path'] = os.path.abspath(args.output)
+        code, payload = request('POST', '/jobs', body, **connect)
+    elif args.command == 'status':
+        code, payload = request('GET', f"/jobs/{args.id}" if args.id else '/jobs', **connect)
+    else:
+        code, payload = request('DELETE', f"/jobs/{args.id}", **connect)
+
+    print(json.dumps(payload, indent=1))
+    return 0 if code < 400 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# streaming mode for video shittifier
+#
+# Reads a video from a pipe (or any file descriptor) and writes fragmented MP4 or Matroska to
+# another one, so compression can sit inline in a shell or network pipeline without temp files:
+#
+#   curl -s https://example.com/clip.mp4 | python main.py - -t 8 > small.mp4
+#   python main.py - -p 30 --format mkv --size-hint 52428800 < clip.mkv | ssh host 'cat > small.mkv'
+#
+# A pipe has no size and can't be seeked, so the first few MB are read and probed from memory, then
+# handed to ffmpeg ahead of the rest of the stream. Where the header doesn't tell (MP4 with the moov
+# atom at the end, live Matroska), the size and duration hints fill in.
+#
+# MP4 with the moov atom at the end (what cameras and a plain ffmpeg encode write) can't be decoded
+# from a pipe at all: the demuxer has to jump to the index and back. Those are spooled to a temporary
+# file first, which costs the disk space of the input but nothing else.
+
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import tempfile
+import threading
+
+from engines import FFmpegEngine
+from geometry import plan_geometry, geometry_filters, MIN_BPP
+from probe import probe, probe_bytes
+from progress import PROGRESS_ARGS, ProgressParser
+
+PEEK_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Fragmented MP4 needs no seeking back to write the moov atom, so it can go straight into a pipe
+OUTPUT_FORMATS = {
+    'mp4': ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof'],
+    'mkv': ['-f', 'matroska'],
+}
+
+
+def _read_head(fd, size):
+    """Read up to size bytes; less only at the end of the stream"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = os.read(fd, min(remaining, CHUNK_SIZE * 16))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def moov_at_end(head):
+    """True if head starts an MP4 whose media data comes before its moov atom (the index).
+    Walks the top-level boxes; False when it's not MP4 or the head ends before telling."""
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack('>I4s', head[offset:offset + 8])
+        if offset == 0 and kind != b'ftyp':
+            return False
+        if kind == b'moov':
+            return False
+        if kind == b'mdat':
+            return True
+        if size == 1:
+            if offset + 16 > len(head):
+                return False
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def _spool(head, fd):
+    """Write head and the rest of the stream to a temporary file; returns its path"""
+    spool = tempfile.NamedTemporaryFile(prefix='shittifier_stream_', suffix='.mp4', delete=False)
+    with spool:
+        spool.write(head)
+        with os.fdopen(os.dup(fd), 'rb') as source:
+            shutil.copyfileobj(source, spool, CHUNK_SIZE * 16)
+    return spool.name
+
+
+def _relay(head, fd, sink, stats):
+    """Feed ffmpeg the bytes that were read for probing, then the rest of the stream"""
+    try:
+        sink.write(head)
+        stats['size'] += len(head)
+        while True:
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            stats['size'] += len(chunk)
+            sink.write(chunk)
+    except (BrokenPipeError, OSError):
+        # ffmpeg stopped reading, its exit code tells the real story
+        pass
+    finally:
+        try:
+            sink.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def compress_stream(input_fd=0, output_fd=1, target_size_mb=None, percentage=None, audio_quality='medium',
+                    threads=None, preset='medium', output_format='mp4', size_hint=None, duration_hint=None,
+                    downscale=True, on_progress=None):
+    """Compress the video arriving on input_fd and write it to output_fd as output_format ('mp4' or 'mkv').
+    size_hint (bytes) and duration_hint (seconds) stand in for what a pipe can't tell us: the size is
+    needed for percentage mode, the duration for any bitrate. Returns a result dict like compress_video."""
+    from api import calculate_bitrates, audio_ratio_for
+    from scheduler import plan_job
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'. Choose from: {', '.join(OUTPUT_FORMATS)}")
+    engine = FFmpegEngine()
+
+    size = size_hint
+    mode = os.fstat(input_fd).st_mode
+    seekable = stat.S_ISREG(mode)
+    if size is None and seekable:
+        size = os.fstat(input_fd).st_size - os.lseek(input_fd, 0, os.SEEK_CUR)
+
+    info = None
+    head = None
+    spool_path = None
+    # A pipe is always peeked at, to catch MP4 that can't be read from one
+    if not seekable or duration_hint is None or (size is None and percentage is not None):
+        fd_path = f'/proc/{os.getpid()}/fd/{input_fd}'
+        if seekable and os.path.exists(fd_path):
+            # A regular file can be probed whole through the fd, moov atom at the end or not
+            try:
+                info = probe(fd_path)
+            except IOError:
+                info = None
+        elif seekable:
+            start = os.lseek(input_fd, 0, os.SEEK_CUR)
+            info = probe_bytes(_read_head(input_fd, PEEK_SIZE), size)
+            os.lseek(input_fd, start, os.SEEK_SET)
+        else:
+            head = _read_head(input_fd, PEEK_SIZE)
+            if len(head) < PEEK_SIZE and size is None:
+                size = len(head)  # the whole input fit in the peek
+            if moov_at_end(head):
+                spool_path = _spool(head, input_fd)
+                head = None
+                size = size_hint or os.path.getsize(spool_path)
+                info = probe(spool_path)
+            elif duration_hint is None or (size is None and percentage is not None):
+                info = probe_bytes(head, size)
+
+    try:
+        duration = duration_hint or (info.duration if info else 0)
+        if not duration:
+            raise IOError("Could not read the duration from the start of the stream. Pass a duration hint.")
+        if size is None and info and info.bit_rate:
+            size = int(info.bit_rate * duration / 8)
+
+        if percentage is not None:
+            if size is None:
+                raise IOError("The input size is unknown, so a percentage can't be worked out. Pass a size hint "
+                              "or use a target size.")
+            target_size_mb = size / (1024 * 1024) * (percentage / 100)
+        target_size_mb = max(0.1, target_size_mb)
+
+        # Unknown audio (no probe) still gets the audio share; the track is mapped only if it exists
+        has_audio = info.has_audio if info else True
+        video_bitrate, audio_bitrate = calculate_bitrates(target_size_mb, duration, has_audio,
+                                                          audio_ratio_for(audio_quality))
+        if threads is None:
+            threads = plan_job(info)
+        # Without a probe there's no source geometry to scale from
+        geometry = plan_geometry(info, video_bitrate, min_bpp=MIN_BPP if downscale else 0) if info and info.has_video else None
+        engine.video_filters = geometry_filters(geometry)
+
+        # ffmpeg's pipe: protocol never seeks, which MP4 with the moov atom at the end needs. A regular
+        # file handed over as stdin can be opened through /dev/stdin instead, and then it can.
+        source = '/dev/stdin' if seekable and head is None and os.path.exists('/dev/stdin') else 'pipe:0'
+        if spool_path:
+            source = spool_path
+        cmd = engine.build_command(source, 'pipe:1', video_bitrate, audio_bitrate, has_audio, threads, preset,
+                                   audio_optional=info is None)
+        cmd = cmd[:1] + PROGRESS_ARGS + cmd[1:-1] + OUTPUT_FORMATS[output_format] + cmd[-1:]
+
+        # ffmpeg reports the bytes it wrote in its progress blocks, which is the only way to know the
+        # output size when it goes into a pipe
+        last = {'total_size': 0}
+
+        def track(event):
+            last['total_size'] = event['total_size'] or last['total_size']
+            if on_progress:
+                on_progress(event)
+
+        parser = ProgressParser(track, duration, 'encode')
+        stats = {'size': 0}
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE if head is not None else
+                                   subprocess.DEVNULL if spool_path else input_fd,
+                                   stdout=output_fd, stderr=subprocess.PIPE)
+        relay = None
+        if head is not None:
+            relay = threading.Thread(target=_relay, args=(head, input_fd, process.stdin, stats), daemon=True)
+            relay.start()
+        try:
+            for line in process.stderr:
+                parser.feed(line)
+            process.wait()
+        except BaseException:
+            process.kill()
+            raise
+        if relay:
+            relay.join()
+        if process.returncode != 0:
+            raise IOError(f"ffmpeg exited with code {process.returncode}: {' | '.join(parser.other_lines[-3:])}")
+
+        if relay and size_hint is None:
+            size = stats['size']
+        original_size = size / (1024 * 1024) if size else None
+        final_size = last['total_size'] / (1024 * 1024)
+        return {
+            'original_size': original_size,
+            'final_size': final_size,
+            'compression_ratio': (original_size - final_size) / original_size * 100 if original_size else None,
+            'size_increased': final_size > original_size if original_size else False,
+            'audio_quality': audio_quality,
+            'target_size': target_size_mb,
+            'size_error_percent': (final_size - target_size_mb) / target_size_mb * 100,
+            'rate_control': 'single',
+            'passes': None,
+            'segments': None,
+            'resumed_segments': None,
+            'estimate': None,
+            'generations': None,
+            'streams': None,
+            'geometry': geometry,
+            'effects': None,
+            'cached': False,
+            'peak_rss_mb': None,
+            'memory_limit_mb': None,
+            'output_format': output_format,
+        }
+    finally:
+        if spool_path:
+            os.remove(spool_path)
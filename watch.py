@@ -0,0 +1,376 @@
+# watch-folder mode for video shittifier
+#
+# Watches a directory that uploads get dropped into and compresses every new or changed video with
+# a fixed profile. inotify is used where available (Linux, through ctypes), otherwise the directory
+# is polled. A file is only picked up once its size and mtime have stopped changing for a while, so
+# half-uploaded files are left alone.
+#
+# Every finished input is recorded in a manifest (size, mtime, content hash, output and result), so a
+# restart only encodes what is new. A file that was merely touched (same content hash) is not
+# encoded again, a file that was replaced is.
+#
+#   python watch.py uploads/ -p 30                        (outputs go to uploads/compressed/)
+#   python watch.py uploads/ --profile profile.json -o /srv/small --jobs 2
+#   python watch.py uploads/ -t 8 --once                  (process what is there and exit)
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from colorama import init, Fore, Style
+
+from batch import VIDEO_EXTENSIONS, output_path_for, parse_audio_quality, _compress_job
+from cache import content_hash
+from service import JOB_OPTIONS
+
+init()
+
+MANIFEST_NAME = '.shittifier_manifest.json'
+# A file that fails is tried this many times in a row, after that only once it changes
+MAX_ATTEMPTS = 3
+OUTPUT_SUFFIX = '_compressed'
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC if hasattr(os, 'O_CLOEXEC') else 0
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Reports names in a directory that were written to, created or moved in"""
+
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library('c')
+        if sys.platform != 'linux' or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Names that changed within timeout seconds. None means the kernel queue overflowed
+        and the caller should rescan the directory."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback for systems without inotify: just report everything every interval"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory, polling=False):
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"{Fore.YELLOW}inotify not available ({e}), polling the directory instead{Style.RESET_ALL}")
+    return PollingWatcher(directory)
+
+
+def _finished(entry):
+    """Whether a manifest entry is done with: encoded, or failed MAX_ATTEMPTS times in a row"""
+    return entry['status'] == 'done' or entry.get('attempts', 1) >= MAX_ATTEMPTS
+
+
+class Manifest:
+    """JSON record of every processed input, keyed by file name.
+    Written to a temp file and renamed, so a crash never leaves a half-written manifest."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, name, path, stat, profile):
+        """Whether name was already handled with this profile and hasn't changed since.
+        A changed size/mtime falls back to the content hash, so a touched file isn't redone.
+        A failed file is not current until it has used up its attempts."""
+        entry = self.entries.get(name)
+        if entry is None or entry['profile'] != profile or not _finished(entry):
+            return False
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        if entry['size'] != stat.st_size:
+            return False
+        try:
+            same = content_hash(path) == entry['hash']
+        except OSError:
+            return False
+        if same:
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self.save()
+        return same
+
+    def record(self, name, path, stat, file_hash, profile, outcome):
+        previous = self.entries.get(name)
+        attempts = 1
+        if previous and previous['status'] == 'failed' and previous['hash'] == file_hash and previous['profile'] == profile:
+            attempts = previous.get('attempts', 1) + 1
+        self.entries[name] = {
+            'path': path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': file_hash,
+            'profile': profile,
+            'status': 'done' if outcome['result'] is not None else 'failed',
+            'output': outcome['output'],
+            'result': outcome['result'],
+            'error': outcome['error'],
+            'attempts': attempts,
+            'finished': time.time(),
+        }
+        self.save()
+
+
+def load_profile(path):
+    """compress_video options from a JSON file, e.g. {"target_size_mb": 8, "audio_quality": "low"}"""
+    with open(path, 'r') as f:
+        profile = json.load(f)
+    unknown = set(profile) - JOB_OPTIONS
+    if unknown:
+        raise ValueError(f"Unknown profile option(s): {', '.join(sorted(unknown))}")
+    if profile.get('percentage') is None and profile.get('target_size_mb') is None:
+        raise ValueError("The profile needs a percentage or a target_size_mb")
+    return profile
+
+
+class FolderWatcher:
+    """Debounces the files of one directory and hands settled ones to a process pool"""
+
+    def __init__(self, directory, profile, output_dir=None, manifest_path=None, settle=5.0,
+                 interval=2.0, jobs=1, polling=False):
+        self.directory = os.path.abspath(directory)
+        self.profile = profile
+        self.output_dir = os.path.abspath(output_dir or os.path.join(self.directory, 'compressed'))
+        self.manifest = Manifest(manifest_path or os.path.join(self.directory, MANIFEST_NAME))
+        self.settle = settle
+        self.interval = interval
+        self.jobs = jobs
+        self.polling = polling
+        self.pending = {}   # name -> (size, mtime_ns, last time either changed)
+        self.running = {}   # future -> (name, path, stat, hash)
+
+    def _wanted(self, name):
+        stem, ext = os.path.splitext(name)
+        return ext.lower() in VIDEO_EXTENSIONS and not stem.endswith(OUTPUT_SUFFIX) and not name.startswith('.')
+
+    def _note(self, names):
+        """Start (or restart) the settle timer of every new or changed file in names"""
+        busy = {job[0] for job in self.running.values()}
+        for name in names:
+            if not self._wanted(name) or name in busy:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.pending.pop(name, None)
+                continue
+            if not os.path.isfile(path):
+                continue
+            previous = self.pending.get(name)
+            if previous and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                continue
+            if previous is None and self.manifest.is_current(name, path, stat, self.profile):
+                continue
+            self.pending[name] = (stat.st_size, stat.st_mtime_ns, time.time())
+
+    def _settled(self):
+        """Pending files whose size and mtime haven't moved for self.settle seconds"""
+        now = time.time()
+        ready = []
+        for name, (size, mtime_ns, changed) in list(self.pending.items()):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[name]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.pending[name] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - changed >= self.settle and stat.st_size > 0:
+                del self.pending[name]
+                ready.append((name, path, stat))
+        return ready
+
+    def _submit(self, pool, name, path, stat):
+        file_hash = content_hash(path)
+        entry = self.manifest.entries.get(name)
+        if entry and entry['hash'] == file_hash and entry['profile'] == self.profile and _finished(entry):
+            # Same content under a new mtime (copied over again, touched...)
+            entry['size'], entry['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+            self.manifest.save()
+            return
+        job = {
+            'input_path': path,
+            'output_path': output_path_for(path, self.output_dir),
+            'options': dict(self.profile),
+        }
+        print(f"{Fore.BLUE}[QUEUED] {name}{Style.RESET_ALL}")
+        self.running[pool.submit(_compress_job, job)] = (name, path, stat, file_hash)
+
+    def _collect(self):
+        for future in [f for f in self.running if f.done()]:
+            name, path, stat, file_hash = self.running.pop(future)
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {'input': path, 'output': None, 'result': None, 'error': str(e), 'elapsed': 0}
+            self.manifest.record(name, path, stat, file_hash, self.profile, outcome)
+            if outcome['result'] is None:
+                print(f"{Fore.RED}[FAIL] {name}: {outcome['error']}{Style.RESET_ALL}")
+            else:
+                result = outcome['result']
+                print(f"{Fore.GREEN}[DONE] {name} -> {outcome['output']} "
+                      f"({result['original_size']:.2f}MB -> {result['final_size']:.2f}MB, {outcome['elapsed']:.1f}s){Style.RESET_ALL}")
+            # The input may have been replaced while it was being encoded
+            self._note([name])
+
+    def _scan(self):
+        self._note(sorted(os.listdir(self.directory)))
+
+    def run(self, once=False):
+        """Watch until interrupted. With once=True, process what is there and return."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        watcher = make_watcher(self.directory, self.polling)
+        kind = 'inotify' if isinstance(watcher, InotifyWatcher) else f"polling every {self.interval:g}s"
+        print(f"{Fore.BLUE}Watching {self.directory} ({kind}), outputs in {self.output_dir}{Style.RESET_ALL}")
+        self._scan()
+        try:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                while True:
+                    for name, path, stat in self._settled():
+                        self._submit(pool, name, path, stat)
+                    self._collect()
+                    if once and not self.pending and not self.running:
+                        return
+                    names = watcher.wait(min(self.interval, self.settle / 2) if self.pending else self.interval)
+                    if names is None:
+                        self._scan()
+                    else:
+                        self._note(names)
+        finally:
+            watcher.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Compress every new video dropped into a directory")
+    parser.add_argument('directory', help="directory to watch")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('-p', '--percentage', type=float, help="target percentage of the original size (0-100)")
+    mode.add_argument('-t', '--target-size', type=float, help="target size in MB")
+    parser.add_argument('-a', '--audio-quality', type=parse_audio_quality, default=None,
+                        help="h/m/l/v or a 1-100 custom percentage of the total bitrate (default: medium)")
+    parser.add_argument('--speed', default=None,
+                        help="fastest, faster, fast, balanced, quality, best or an x264 preset name")
+    parser.add_argument('--profile', help="JSON file with compress_video options; command line options override it")
+    parser.add_argument('-o', '--output-dir', help="where outputs go (default: <directory>/compressed)")
+    parser.add_argument('--manifest', help=f"manifest file (default: <directory>/{MANIFEST_NAME})")
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help="seconds a file's size and mtime must stay the same before it is picked up (default: 5)")
+    parser.add_argument('--interval', type=float, default=2.0, help="polling interval in seconds (default: 2)")
+    parser.add_argument('--poll', action='store_true', help="poll even where inotify is available")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="files to compress at the same time (default: 1)")
+    parser.add_argument('--once', action='store_true', help="process what is in the directory now and exit")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    try:
+        profile = load_profile(args.profile) if args.profile else {}
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.percentage is not None:
+        profile.pop('target_size_mb', None)
+        profile['percentage'] = args.percentage
+    if args.target_size is not None:
+        profile.pop('percentage', None)
+        profile['target_size_mb'] = args.target_size
+    if args.audio_quality is not None:
+        profile['audio_quality'] = args.audio_quality
+    if args.speed is not None:
+        from scheduler import preset_for
+        try:
+            profile['preset'] = preset_for(args.speed)
+        except ValueError as e:
+            parser.error(str(e))
+    if profile.get('percentage') is None and profile.get('target_size_mb') is None:
+        parser.error("give -p/--percentage, -t/--target-size or a --profile with one of them")
+    if profile.get('percentage') is not None and not 0 < profile['percentage'] < 100:
+        parser.error("percentage must be between 0 and 100")
+
+    watcher = FolderWatcher(args.directory, profile, output_dir=args.output_dir, manifest_path=args.manifest,
+                            settle=args.settle, interval=args.interval, jobs=args.jobs, polling=args.poll)
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        print(f"\n{Fore.BLUE}Stopped watching.{Style.RESET_ALL}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())